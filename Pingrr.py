@@ -1,13 +1,31 @@
+import argparse
 import logging
 import os
+import signal
 import sys
-from pushover import Pushover
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
 import requests
 
 import config
+from lib import asodarr
+from lib import batch
+from lib import cache
+from lib import decisions
+from lib import filters
+from lib import instances
+from lib import library
+from lib import listener
+from lib import logs
+from lib import metadata
+from lib import notify
+from lib import ranking
+from lib import replay
+from lib import scheduler
+from lib import session
 from lib import sodarr
+from lib import stats
 from lib import trakt
 
 filename, file_extension = os.path.splitext(os.path.basename(__file__))
@@ -24,76 +42,100 @@ fileHandler.setFormatter(formatter)
 logger.addHandler(fileHandler)
 
 # new = []
-options = {"ignoreEpisodesWithFiles": False, "ignoreEpisodesWithoutFiles": False,
-           "searchForMissingEpisodes": config.sonarr_search_missing_episodes}
 
 
-def send_to_sonarr(a, b, ):
-    """Send found tv program to sonarr"""
-
-    logger.info("Attempting to send to sonarr")
-    payload = {"tvdbId": a, "title": b, "qualityProfileId": config.sonarr_quality_profile, "images": [],
-               "seasons": [], "seasonFolder": True, "monitored": config.sonarr_monitored,
-               "rootFolderPath": config.sonarr_path_root,
-               "addOptions": options,
-               "tags": [config.sonarr_tag_id]}
+def sonarr_payload(instance, a, b):
+    """Sonarr add payload for a found tv program"""
+    return {"tvdbId": a, "title": b, "qualityProfileId": instance['quality_profile'], "images": [],
+            "seasons": [], "seasonFolder": True, "monitored": instance['monitored'],
+            "rootFolderPath": instance['path_root'],
+            "addOptions": {"ignoreEpisodesWithFiles": False, "ignoreEpisodesWithoutFiles": False,
+                           "searchForMissingEpisodes": instance['search']},
+            "tags": [instance['tag_id']] if instance['tag_id'] is not None else []}
+
+
+def radarr_payload(instance, a, b, year):
+    """Radarr add payload for a found movie, the search is sent for all added movies at once"""
+    return {"tmdbId": a,
+            "title": b,
+            "qualityProfileId": instance['quality_profile'],
+            "images": [],
+            "monitored": instance['monitored'],
+            "titleSlug": b,
+            "rootFolderPath": instance['path_root'],
+            "minimumAvailability": instance['minimum_availability'],
+            "year": year,
+            "addOptions": {
+                "searchForMovie": False
+            },
+            "tags": [instance['tag_id']] if instance['tag_id'] is not None else []
+            }
+
+
+def send_media(instance, payloads):
+    """Send payloads to a sonarr or radarr instance, returns a result dict per payload (see sodarr.bulk_add)"""
+    logger.info("Attempting to send {} titles to {}".format(len(payloads), instance.name))
 
     if config.pingrr_dry_run:
-        logger.info("dry run is on, not sending to sonarr")
-    else:
-        response = None
-        try:
-            sdr = sodarr.API(config.sonarr_host + '/api/v3', config.sonarr_api)
-            response = sdr.add_series(payload)
-            logger.debug("sent to sonarr successfully")
-            return True
-        except Exception as a:
-            logger.error('Error on line {} - {} - {}'.format(type(a).__name__, sys.exc_info()[-1].tb_lineno, a))
-            logger.error("failed to send to sonarr, code return: %r", response)
-            return False
-
-
-def send_to_radarr(a, b, year):
-    """Send found tv program to radarr"""
-
-    logger.info("Attempting to send to radarr")
-
-    payload = {"tmdbId": a,
-               "title": b,
-               "qualityProfileId": config.radarr_quality_profile,
-               "images": [],
-               "monitored": config.radarr_monitored,
-               "titleSlug": b,
-               "rootFolderPath": config.radarr_path_root,
-               "minimumAvailability": config.radarr_minimumAvailability,
-               "year": year,
-               "addOptions": {
-                   "searchForMovie": config.radarr_search
-               },
-               "tags": [config.radarr_tag_id]
-               }
+        logger.info("dry run is on, not sending to {}".format(instance.name))
+        return [{'ok': True, 'id': None, 'error': None, 'response': None} for payload in payloads]
 
-    if config.pingrr_dry_run:
-        logger.info("dry run is on, not sending to radarr")
-        return True
+    sdr = instance.api
+    if getattr(config, 'arr_async', False) and asodarr.available():
+        results = asodarr.bulk_add(sdr.host_url, sdr.api_key, instance.program, payloads)
     else:
-        sdr = sodarr.API(config.radarr_host + '/api/v3', config.radarr_api)
-        response = sdr.add_movie(payload)
+        results = sodarr.bulk_add(sdr, instance.program, payloads, getattr(config, 'arr_add_workers', 4))
+
+    movie_ids = [result['id'] for result in results if result['ok']]
+    if instance.program == "radarr" and instance['search'] and movie_ids:
         try:
-            sdr.command({'name': 'MoviesSearch', 'movieIds': [response['id']]})
-            logger.debug("sent to radarr successfully")
-            return True
+            sdr.command({'name': 'MoviesSearch', 'movieIds': movie_ids})
+            logger.debug("sent search for {} movies to {}".format(len(movie_ids), instance.name))
         except Exception as a:
             logger.error('Error on line {} - {} - {}'.format(type(a).__name__, sys.exc_info()[-1].tb_lineno, a))
-            logger.error("failed to send to radarr")
-            logger.error(response)
-            return False
+            logger.error("failed to send movie search to {}".format(instance.name))
+    return results
+
+
+def record_added(index, response):
+    """Add a title sonarr/radarr accepted to the library index, so it is known before the next full sync"""
+    if isinstance(response, dict) and response.get('id'):
+        index.add(library.from_arr(response))
+
+
+def confirm_in_library(instance, media_id):
+    """Ask sonarr/radarr whether a title missing from a stale library index was added since the last sync"""
+    with stats.span('in_library.' + instance.name):
+        return sodarr.in_library(instance.library, instance.host, instance.api_key, media_id)
+
+
+def message_entry(item_type, media):
+    """Notification text for an added title, with the fields listed in message_attributes"""
+    url = "https://trakt.tv/%s/%s" % (item_type, media['trakt'])
+    lines = []
+    for y in media:
+        if y not in config.message_attributes:
+            continue
+
+        data = media[y]
+        if isinstance(data, (list, tuple)):
+            data = ", ".join(data)
+        if y == 'title':
+            data = "<a href='%s'>%s</a>" % (url, data)
 
+        lines.append("%s: %s\n" % (y.title(), data))
+    lines.append("\n")
+    return "".join(lines)
 
-def add_media(item_type, new):
-    program = "radarr" if item_type == "movies" else "sonarr"
+
+def add_media(instance, new):
+    item_type = instance.item_type
+    program = instance.program
+    index = instance.library
     added_list = []
-    message = ""
+    entries = []
+    to_send = []
+    payloads = []
     for media in new:
         media_id = None
         title = media['title']
@@ -103,203 +145,302 @@ def add_media(item_type, new):
         elif program == "sonarr":
             media_id = media['tvdb']
 
-        if media_id:
-            try:
-                logger.debug('Sending media to {}: {}'.format(program, media['title']))
-                if program == "sonarr":
-                    if send_to_sonarr(media_id, title):
-                        logger.info('{} has been added to Sonarr'.format(title))
-                        added_list.append("TV - %s" % media['title'])
-                if program == "radarr":
-                    if send_to_radarr(media_id, title, media['year']):
-                        logger.info('{} has been added to Radarr'.format(title))
-                        added_list.append("Movie - %s" % media['title'])
-            except IOError:
-                logger.warning('error sending media: {} id: {}'.format(title, str(media_id)))
-
-            url = "https://trakt.tv/%s/%s" % (item_type, media['trakt'])
-            for y in media:
-                if y not in config.message_attributes:
-                    continue
-
-                data = media[y]
-                if isinstance(data, list):
-                    data = ", ".join(data)
-                if y == 'title':
-                    data = "<a href='%s'>%s</a>" % (url, data)
-
-                message += "%s: %s\n" % (y.title(), data)
-            message += "\n"
+        if not media_id:
+            logger.error("Failed Adding %s to %s - No TMDB/TVDB Id Found" % (title, instance.name))
+            continue
+
+        if index.stale and confirm_in_library(instance, media_id):
+            logger.info('{} was added to {} since the last full library sync, skipping'.format(title, instance.name))
+            continue
+
+        logger.debug(logs.Lazy('Sending media to {}: {}', instance.name, media['title']))
+        to_send.append(media)
+        if program == "radarr":
+            payloads.append(radarr_payload(instance, media_id, title, media['year']))
         else:
-            logger.error("Failed Adding %s to %s - No TMDB/TVDB Id Found" % (title, program))
-            
-    if config.pushover_enabled and message:
-        send_message(title="New %s Added to Plex" % item_type.title(), text=message, html=1)
+            payloads.append(sonarr_payload(instance, media_id, title))
 
+    with stats.span('add.' + instance.name):
+        results = send_media(instance, payloads) if payloads else []
 
-def new_check(item_type):
-    logger.info('checking for new {} in lists'.format(item_type))
-    new = filter_list(item_type)
-    if new:
-        logger.info('new media found, adding {} {} now'.format(len(new), item_type))
-        add_media(item_type, new)
+    for media, result in zip(to_send, results):
+        title = media['title']
+        if not result['ok']:
+            logger.warning('error sending media: {} to {}: {}'.format(title, instance.name, result['error']))
+            stats.count('add_failed.' + instance.name)
+            continue
 
+        logger.info('{} has been added to {}'.format(title, instance.name))
+        stats.count('added.' + instance.name)
+        added_list.append("%s - %s" % ("Movie" if program == "radarr" else "TV", title))
+        record_added(index, result['response'])
 
-def check_lists(arg, arg2):
-    for filters in arg:
-        for data in arg2:
-            if filters == data:
-                return True
-    return False
+        entries.append(message_entry(item_type, media))
 
+    if added_list:
+        index.persist()
 
-def filter_check(title, item_type):
-    if item_type == "shows":
-        if len(title['country']):
-            country = title['country'].lower()
-        else:
-            country = False
-        type_id = "tvdb"
-        library = sonarr_library
-    elif item_type == "movies":
-        type_id = "tmdb"
-        library = radarr_library
-        country = False
+    if len(instances.load(program)) > 1:
+        heading = "New %s Added to %s" % (item_type.title(), instance.name)
     else:
-        return False
-
-    lang = title['language']
-
-    if title[type_id] not in library:
-        logger.debug("Checking year: {}".format(title['year']))
-        if config.filters_year[item_type] > title['year']:
-            logger.info(
-                "{} was rejected as it was outside allowed year range: {}".format(title['title'], str(title['year'])))
-            return False
-
-        logger.debug("Checking runtime: {}".format(title['runtime']))
-        if config.filters_runtime > title['runtime']:
-            logger.info(
-                "{} was rejected as it was outside allowed runtime: {}".format(title['title'], str(title['runtime'])))
-            return False
-
-        if item_type == "shows":
-            if len(config.filters_network) > 0:
-                if title['network'] is None or title['network'] in config.filters_network:
-                    logger.info("{} was rejected as it was by a disallowed network: {}".format(title['title'], str(title['network'])))
-                    return False
-        logger.debug("Checking votes: {}".format(title['votes']))
-
-        if config.filters_votes > title['votes']:
-            logger.info(
-                "{} was rejected as it did not meet vote requirement: {}".format(title['title'], str(title['votes'])))
-            return False
-
-        if config.filters_allow_ended is False and 'ended' in title['status']:
-            logger.info("{} was rejected as it is an ended tv series".format(title['title']))
-            return False
-
-        if item_type == "shows":
-            if config.filters_allow_canceled is False and 'canceled' in title['status']:
-                logger.info("{} was rejected as it is a canceled tv show".format(title['title']))
-                return False
-
-        if item_type == "shows":
-            if config.filters_allow_returning is False and 'returning' in title['status']:
-                logger.info("{} was rejected as it is a returning tv show".format(title['title']))
-                return False
-
-        logger.debug("Checking rating: {}".format(title['rating']))
-        if float(title['rating']) < float(config.filters_rating):
-            logger.info("{} was rejected as it was outside the allowed ratings: {}".format(title['title'], str(title['rating'])))
-            return False
-
-        logger.debug("Checking genres: {}".format(title['genres']))
-        if isinstance(config.filters_genre, list):
-            if check_lists(config.filters_genre, title['genres']):
-                logger.info("{} was rejected as it wasn't a wanted genre: {}".format(title['title'], str(title['genres'])))
-                return False
-        elif title['genres'] in config.filters_genre:
-            logger.info("{} was rejected as it wasn't a wanted genre: {}".format(title['title'], str(title['genres'])))
-            return False
-
-        logger.debug("Checking country: {}".format(country))
-        if country and country not in config.filters_country:
-            logger.info("{} was rejected as it wasn't a wanted country: {}".format(title['title'],
-                                                                                   str(title['country'])))
-            return False
-
-        logger.debug("Checking language: {}".format(lang))
-        if lang not in config.filters_language:
-            logger.info("{} was rejected as it wasn't a wanted language: {}".format(title['title'], lang))
-            return False
-        return True
+        heading = "New %s Added to Plex" % item_type.title()
+    for entry in entries:
+        notify.add(heading, entry)
+    return len(added_list)
+
+
+def new_check(instance, titles):
+    logger.info('checking for new {} in lists for {}'.format(instance.item_type, instance.name))
+    # includes waiting for trakt pages when the lists are still downloading
+    with stats.span('filter.' + instance.name):
+        new = filter_list(instance, titles)
+    if not new:
+        return
+    budget = ranking.AddBudget(instance.name, instance['add_budget_run'] or 0, instance['add_budget_day'] or 0)
+    new = ranking.select(new, budget)
+    if new:
+        logger.info('new media found, adding {} {} to {} now'.format(len(new), instance.item_type, instance.name))
+        added = add_media(instance, new)
+        if not config.pingrr_dry_run:
+            budget.record(added)
 
-    else:
-        logger.info("{} was rejected as it is already in {} library".format(title['title'], item_type))
 
+def log_rejection(title, rule):
+    """Per title rejections are only formatted at debug level, for the share kept by log_sample_rate"""
+    if logger.isEnabledFor(logging.DEBUG) and logs.sampled():
+        logger.debug("{} was rejected as {}".format(title['title'], filters.describe(rule, title)))
 
-def filter_list(list_type):
-    # Create the lists ready to be filtered down
-    item_id = None
-    raw_list = []
-    if list_type == 'shows':
-        item_id = "tvdb"
-        if any((config.trakt_tv_list[trakt_list] for trakt_list in config.trakt_tv_list)):
-            raw_list = trakt.get_info('tv')
-
-    if list_type == 'movies':
-        item_id = "tmdb"
-        if any((config.trakt_movie_list[trakt_list] for trakt_list in config.trakt_movie_list)):
-            raw_list = trakt.get_info('movie')
 
-    filtered = []
-    for title in raw_list:
+def compile_filters(instance):
+    return filters.compile_filters(instance.item_type, instance.library, instance.filter_setting)
+
+
+def iter_checked(pipeline, titles):
+    """Yield (title, passed, rule) checking one title at a time"""
+    for title in titles:
         try:
-            # If not already in the list, check against filters
-            if filter_check(title, list_type) and title[item_id] not in filtered:
-                logger.info('adding {} to potential add list'.format(title['title']))
-                filtered.append(title)
+            passed, rule = pipeline.check(title)
         except TypeError:
-            logger.debug('{} failed to check against filters'.format(title['title']))
+            logger.debug(logs.Lazy('{} failed to check against filters', title['title']))
+            continue
+        yield title, passed, rule
 
-    logger.debug("Filtered list successfully")
 
-    return filtered
+def check_titles(titles, pipeline, decided, rejections):
+    """Yield (title, passed) for each title that was not rejected unchanged on an earlier run
 
+    Rejections are counted in rejections, a logs.Rejections. Titles are checked in vectorised
+    batches when filters_batch_size is set."""
+    unknown = (title for title in titles if decided.known(title) is None)
+    batch_size = getattr(config, 'filters_batch_size', 0)
+    if batch_size and batch.numpy is not None:
+        checked = batch.iter_checked(pipeline, unknown, batch_size)
+    else:
+        checked = iter_checked(pipeline, unknown)
 
-def send_message(text, **kwargs):
-    logger.debug("Sending Pushover Message. Text:%s, %s" % (text, kwargs))
-    po = Pushover(config.pushover_app_token)
-    po.user(config.pushover_user_key)
-    msg = po.msg(text)
-    for x in kwargs:
-        msg.set(x, kwargs[x])
-    logger.debug(po.send(msg))
+    for title, passed, rule in checked:
+        decided.record(title, rule)
+        if not passed:
+            rejections.add(title, rule)
+            log_rejection(title, rule)
+        yield title, passed
 
 
-if __name__ == "__main__":
-    logger.info("###### Checking if TV lists are wanted ######")
-    if config.sonarr_api:
+def filter_list(instance, titles):
+    # Create the lists ready to be filtered down
+    item_id = "tmdb" if instance.program == "radarr" else "tvdb"
+    pipeline = compile_filters(instance)
+
+    filtered = []
+    filtered_ids = set()
+    decided = decisions.DecisionStore(instance.name, pipeline.fingerprint)
+    rejections = logs.Rejections()
+    checked = 0
+    for title, passed in check_titles(titles, pipeline, decided, rejections):
+        checked += 1
+        # If not already in the list, check against filters
+        if passed and title[item_id] not in filtered_ids:
+            logger.debug(logs.Lazy('adding {} to potential add list', title['title']))
+            filtered.append(title)
+            if title[item_id]:
+                filtered_ids.add(title[item_id])
+
+    decided.save()
+    rejections.log(logger, instance.name)
+    stats.count('candidates.' + instance.name, checked)
+    for rule, count in rejections.counts.items():
+        stats.count('rejected.' + rule, count)
+    logger.info("{} of {} checked titles passed the {} filters".format(len(filtered), checked, instance.name))
+
+    return filtered
+
+
+def load_library(instance):
+    """Sync the library of an instance into instance.library, falling back to the index in memory or saved by
+    the last run if it times out
+
+    While webhooks are received, the events of the sync are queued and replayed onto the new index, and an
+    index synced that way is kept current by the webhooks from then on."""
+    current = instance.library
+    watching = listener.begin_refresh(instance.name)
+    try:
         try:
-            sonarr_library = sodarr.get_sonarr_library()
-            new_check('shows')
+            fetch = asodarr.get_library if getattr(config, 'arr_async', False) and asodarr.available() else None
+            with stats.span('library.' + instance.name):
+                index = sodarr.sync_library(instance.program, instance.host, instance.api_key,
+                                            sodarr.ENDPOINTS[instance.program], current, instance.name, fetch)
+            stats.count('library_size.' + instance.name, len(index))
+            if watching and not index.stale:
+                # downloaded or confirmed unchanged by sonarr/radarr after the webhooks were queued
+                index.live = True
         except requests.exceptions.ReadTimeout:
-            logger.warning("Sonarr library timed out, skipping for now")
-        except requests.exceptions.ConnectionError:
-            logger.warning("Can not connect to Sonarr, check sonarr is running or host is correct")
-        except Exception as e:
-            logger.error('Error on line {}, {}, {}'.format(sys.exc_info()[-1].tb_lineno, type(e).__name__, e))
+            index = current or library.LibraryIndex.load(instance.program, name=instance.name)
+            if index is None:
+                raise
+            logger.warning("{} library timed out, using saved index of {} items".format(instance.name, len(index)))
+            index.stale = True
+        if index.live and listener.running():
+            index.stale = False
+        instance.library = index
+        return index
+    finally:
+        listener.end_refresh(instance.name, instance.library)
+
+
+def check_instance(instance, titles):
+    try:
+        instance.resolve()
+    except metadata.UnknownSetting as e:
+        logger.error("{} is misconfigured, skipping it: {}".format(instance.name, e))
+        return
+    except sodarr.Unauthorized as e:
+        logger.error("{}, skipping {}".format(e, instance.name))
+        return
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning("Can not get profiles, root folders and tags from {}: {}".format(instance.name, e))
+        return
+
+    try:
+        load_library(instance)
+        new_check(instance, titles)
+    except requests.exceptions.ReadTimeout:
+        logger.warning("{} library timed out, skipping for now".format(instance.name))
+    except sodarr.Unauthorized as e:
+        logger.error("{}, skipping {}".format(e, instance.name))
+    except requests.exceptions.ConnectionError:
+        logger.warning("Can not connect to {}, check it is running or host is correct".format(instance.name))
+    except Exception as e:
+        logger.error('Error on line {}, {}, {}'.format(sys.exc_info()[-1].tb_lineno, type(e).__name__, e))
+
+
+def check(program, pending=None):
+    """Check the trakt lists against every sonarr or radarr instance
+
+    The lists are fetched once, then each instance filters and adds them in parallel."""
+    targets = instances.load(program)
+    if not targets:
+        return
+    kind = 'movie' if program == 'radarr' else 'tv'
+    titles = trakt.get_info(kind, pending)
+    if len(targets) > 1:
+        # every instance goes through the same titles
+        titles = list(titles)
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            list(pool.map(lambda instance: check_instance(instance, titles), targets))
+    else:
+        check_instance(targets[0], titles)
 
+
+def check_tv(pending=None):
+    logger.info("###### Checking if TV lists are wanted ######")
+    try:
+        check('sonarr', pending)
+    except Exception as e:
+        logger.error('Error on line {}, {}, {}'.format(sys.exc_info()[-1].tb_lineno, type(e).__name__, e))
+
+
+def check_movies(pending=None):
     logger.info("###### Checking if Movie lists are wanted ######")
-    if config.radarr_api:
-        try:
-            radarr_library = sodarr.get_radarr_library()
-            new_check('movies')
-        except requests.exceptions.ReadTimeout:
-            logger.warning("Radarr library timed out, skipping for now")
-        except requests.exceptions.ConnectionError:
-            logger.warning("Can not connect to Radarr, check Radarr is running or host is correct")
-        except Exception as e:
-            logger.error('Error on line {}, {}, {}'.format(sys.exc_info()[-1].tb_lineno, type(e).__name__, e))
+    try:
+        check('radarr', pending)
+    except Exception as e:
+        logger.error('Error on line {}, {}, {}'.format(sys.exc_info()[-1].tb_lineno, type(e).__name__, e))
+
+
+def run_once():
+    if getattr(config, 'record_http', ''):
+        replay.start_recording(config.record_http)
+
+    # Start downloading the trakt lists for both passes while the libraries sync
+    pending_tv = trakt.prefetch('tv') if instances.load('sonarr') else None
+    pending_movie = trakt.prefetch('movie') if instances.load('radarr') else None
+
+    with stats.span('tv'):
+        check_tv(pending_tv)
+    with stats.span('movies'):
+        check_movies(pending_movie)
+    # the tv and movie additions go out together, while the caches are closed
+    notify.flush()
+    cache.close()
+    session.log_stats()
+    notify.close()
+    stats.report()
+    replay.stop_recording()
     logger.info("check finish")
+
+
+def scheduled_check(check_type):
+    """Wrap a check for the daemon, reporting cache and connection use after each run"""
+    def run():
+        stats.reset()
+        check_type()
+        notify.flush()
+        cache.report()
+        session.log_stats()
+        stats.report()
+    return run
+
+
+def get_library(name):
+    """Library index of the instance with that name, for the webhook listener"""
+    instance = instances.find(name)
+    return instance.library if instance is not None else None
+
+
+def run_daemon():
+    """Keep running, checking tv and movies on their own intervals with libraries, connections and caches kept warm"""
+    jitter = getattr(config, 'daemon_jitter', 5) * 60
+    schedule = scheduler.Scheduler()
+    if instances.load('sonarr'):
+        schedule.add('tv', scheduled_check(check_tv), getattr(config, 'daemon_tv_interval', 60) * 60, jitter)
+    if instances.load('radarr'):
+        schedule.add('movie', scheduled_check(check_movies), getattr(config, 'daemon_movie_interval', 60) * 60, jitter)
+
+    signal.signal(signal.SIGTERM, schedule.stop)
+    signal.signal(signal.SIGINT, schedule.stop)
+    webhooks = getattr(config, 'webhook_enabled', False)
+    serve_metrics = getattr(config, 'metrics_enabled', False)
+    if webhooks or serve_metrics:
+        listener.start(get_library if webhooks else None, serve_metrics)
+    logger.info("pingrr daemon started")
+    schedule.run()
+    listener.stop()
+
+    for instance in instances.load('sonarr') + instances.load('radarr'):
+        if instance.library is not None:
+            instance.library.persist()
+    notify.close()
+    cache.close()
+    session.log_stats()
+    logger.info("pingrr daemon stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add trending, popular and anticipated trakt titles to sonarr and radarr")
+    parser.add_argument('--daemon', action='store_true', help="keep running and check on the configured intervals")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+    else:
+        run_once()
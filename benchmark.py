@@ -0,0 +1,436 @@
+"""Offline benchmarks of pingrr, run against local replay servers instead of trakt, sonarr and radarr
+
+    python benchmark.py                         synthetic libraries and lists of the default sizes
+    python benchmark.py --sizes 1000x200,20000x2000 --latency 20
+    python benchmark.py --fixtures run.json     replay exchanges recorded with record_http
+    python benchmark.py --micro 50000           parsing, merging, filtering, logging and record benchmarks
+
+Sizes are <library titles>x<titles per trakt list>. The filters and lists of config.py are used,
+everything else (hosts, data folder, notifications, caching) is pointed at a temporary setup."""
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+GENRES = (['drama'], ['comedy'], ['action', 'thriller'], ['anime'], ['documentary'], ['drama', 'crime'])
+NETWORKS = ('HBO', 'Netflix', 'BBC One', 'YouTube', 'AMC')
+# trakt_url as configured, each run points it at that run's replay server
+TRAKT_URL = getattr(config, 'trakt_url', 'https://api.trakt.tv')
+
+
+def trakt_title(i, movie):
+    """Deterministic trakt movie/show object with varied filter fields"""
+    obj = {'title': '%s %d' % ('Movie' if movie else 'Show', i),
+           'ids': {'trakt': i, 'imdb': 'tt%07d' % i},
+           'rating': 4 + (i % 60) / 10.0,
+           'language': 'fr' if i % 7 == 0 else 'en',
+           'genres': GENRES[i % len(GENRES)],
+           'votes': (i * 37) % 20000,
+           'runtime': 15 + i % 120,
+           'year': 1985 + i % 40}
+    if movie:
+        obj['ids']['tmdb'] = i
+        obj.update(certification='PG-13', released='%d-06-01' % obj['year'])
+    else:
+        obj['ids']['tvdb'] = i
+        obj.update(status=('returning series', 'ended', 'canceled')[i % 3], country='us' if i % 5 else 'jp',
+                   network=NETWORKS[i % len(NETWORKS)], aired_episodes=i % 60)
+    return obj
+
+
+def exchange(host, path, body, method='GET', headers=None):
+    return {'host': host, 'method': method, 'path': path, 'status': 200,
+            'headers': dict({'Content-Type': 'application/json'}, **(headers or {})), 'body': json.dumps(body)}
+
+
+def synthetic(library_size, list_size):
+    """Fixture exchanges, by host, of a sonarr and radarr library and three overlapping trakt lists each"""
+    from lib import replay
+    from lib import trakt
+
+    hosts = {'api.trakt.tv': [], 'sonarr': [], 'radarr': []}
+    pages = int(math.ceil(list_size / float(PAGE_SIZE)))
+    for name, movie in (('shows', False), ('movies', True)):
+        for n, cat in enumerate(('anticipated', 'popular', 'trending')):
+            # the lists overlap by half, so merging has work to do
+            ids = list(range(n * list_size // 2, n * list_size // 2 + list_size))
+            for page in range(1, pages + 1):
+                items = [trakt_title(i, movie) for i in ids[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]]
+                if cat != 'popular':
+                    items = [{'movie' if movie else 'show': item} for item in items]
+                path = replay.path_of(trakt.list_url(name, cat, page))
+                hosts['api.trakt.tv'].append(exchange('api.trakt.tv', path, items,
+                                                      headers={'X-Pagination-Page-Count': str(pages)}))
+
+    for host, endpoint, key, root in (('sonarr', 'series', 'tvdbId', '/tv/'), ('radarr', 'movie', 'tmdbId', '/movies/')):
+        # every other title of the lists is already in the library
+        library = [{'id': n + 1, key: i, 'title': 'Title %d' % i, 'path': root + str(i), 'tags': []}
+                   for n, i in enumerate(range(0, 2 * library_size, 2))]
+        hosts[host].extend([exchange(host, '/api/v3/' + endpoint, library),
+                            exchange(host, '/api/v3/qualityprofile', [{'id': 1, 'name': 'Any'}]),
+                            exchange(host, '/api/v3/rootfolder', [{'path': root, 'freeSpace': 2 ** 40}]),
+                            exchange(host, '/api/v3/tag', [])])
+    return hosts
+
+
+def moved(url, server):
+    """url with its scheme and host replaced by the replay server's"""
+    parts, target = urlsplit(url), urlsplit(server.url)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+
+
+def configure(servers, folder, list_size, synthetic_run):
+    """Point config at the replay servers and a fresh data folder"""
+    config.data_folder = folder
+    config.log_folder = folder
+    config.stats_file = ''
+    config.record_http = ''
+    config.pushover_enabled = False
+    config.notify_backend = 'log'
+    config.webhook_enabled = False
+    config.pingrr_dry_run = False
+    config.trakt_cache_ttl = {}
+    config.rate_limits = dict((urlsplit(server.url).netloc, (100000, 100000)) for server in servers.values())
+    config.trakt_url = TRAKT_URL
+    if synthetic_run:
+        config.trakt_url = moved(TRAKT_URL, servers['api.trakt.tv'])
+    elif urlsplit(TRAKT_URL).netloc in servers:
+        config.trakt_url = moved(TRAKT_URL, servers[urlsplit(TRAKT_URL).netloc])
+
+    if synthetic_run:
+        config.trakt_pages = int(math.ceil(list_size / float(PAGE_SIZE)))
+        config.trakt_tv_list = config.trakt_movie_list = {'anticipated': True, 'popular': True, 'trending': True}
+        for program, root in (('sonarr', '/tv/'), ('radarr', '/movies/')):
+            setattr(config, program + '_instances', [])
+            setattr(config, program + '_host', servers[program].url)
+            setattr(config, program + '_api', 'benchmark')
+            setattr(config, program + '_quality_profile', 1)
+            setattr(config, program + '_path_root', root)
+            setattr(config, program + '_tag_id', None)
+        return
+
+    for program in ('sonarr', 'radarr'):
+        host = getattr(config, program + '_host', None)
+        if host and urlsplit(host).netloc in servers:
+            setattr(config, program + '_host', moved(host, servers[urlsplit(host).netloc]))
+        for settings in getattr(config, program + '_instances', None) or []:
+            if settings.get('host') and urlsplit(settings['host']).netloc in servers:
+                settings['host'] = moved(settings['host'], servers[urlsplit(settings['host']).netloc])
+
+
+def run_pipeline(hosts, latency, folder, list_size=0, synthetic_run=False):
+    """Run Pingrr.run_once against replay servers, returns wall time, requests and peak traced memory"""
+    from lib import instances
+    from lib import replay
+
+    servers = replay.serve(hosts, latency)
+    try:
+        configure(servers, folder, list_size, synthetic_run)
+        import Pingrr
+        instances._instances.clear()
+        tracemalloc.start()
+        start = time.perf_counter()
+        Pingrr.run_once()
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'wall': wall, 'requests': sum(server.requests for server in servers.values()), 'peak_mb': peak / 2.0 ** 20}
+    finally:
+        config.trakt_url = TRAKT_URL
+        for server in servers.values():
+            server.stop()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def traced(func, *args):
+    """Peak memory in MB traced while func runs"""
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2.0 ** 20
+
+
+def old_merge(lists):
+    """The merge trakt.get_info made before titles were de-duplicated by id, a list scan per title"""
+    trakt_complete = []
+    for titles in lists:
+        for line in titles:
+            if line not in trakt_complete:
+                trakt_complete.append(line)
+    return trakt_complete
+
+
+def merge(n, baseline=True):
+    """Time trakt.get_info, and the old merge when baseline is set, on three lists of n titles overlapping by half"""
+    from lib import media, trakt
+
+    def lists():
+        # fresh dicts per run, both merges see titles as trakt.get_info did before they became records
+        return [[media.from_trakt('show', trakt_title(i, False)).to_dict() for i in range(k * n // 2, k * n // 2 + n)]
+                for k in range(3)]
+
+    pending = []
+    for cat, titles in zip(('anticipated', 'popular', 'trending'), lists()):
+        future = Future()
+        future.set_result((titles, 1))
+        pending.append((cat, future))
+    seconds, titles = timed(lambda: list(trakt.get_info('tv', pending)))
+    result = {'seconds': seconds, 'titles': 3 * n, 'merged': len(titles), 'baseline_seconds': None}
+    if baseline:
+        baseline_lists = lists()
+        result['baseline_seconds'] = timed(old_merge, baseline_lists)[0]
+        result['speedup'] = result['baseline_seconds'] / seconds
+    return result
+
+
+def old_check_lists(arg, arg2):
+    for filters in arg:
+        for data in arg2:
+            if filters == data:
+                return True
+    return False
+
+
+def old_filter_check(title, item_type, library):
+    """The filter branch chain of Pingrr.filter_check before the filters were compiled into a pipeline, kept as is"""
+    if item_type == "shows":
+        if len(title['country']):
+            country = title['country'].lower()
+        else:
+            country = False
+        type_id = "tvdb"
+    elif item_type == "movies":
+        type_id = "tmdb"
+        country = False
+    else:
+        return False
+
+    lang = title['language']
+
+    if title[type_id] not in library:
+        logger.debug("Checking year: {}".format(title['year']))
+        if config.filters_year[item_type] > title['year']:
+            logger.info(
+                "{} was rejected as it was outside allowed year range: {}".format(title['title'], str(title['year'])))
+            return False
+
+        logger.debug("Checking runtime: {}".format(title['runtime']))
+        if config.filters_runtime > title['runtime']:
+            logger.info(
+                "{} was rejected as it was outside allowed runtime: {}".format(title['title'], str(title['runtime'])))
+            return False
+
+        logger.debug("Checking votes: {}".format(title['votes']))
+        if config.filters_votes > title['votes']:
+            logger.info(
+                "{} was rejected as it did not meet vote requirement: {}".format(title['title'], str(title['votes'])))
+            return False
+
+        if config.filters_allow_ended is False and 'ended' in title['status']:
+            logger.info("{} was rejected as it is an ended tv series".format(title['title']))
+            return False
+
+        if item_type == "shows":
+            if config.filters_allow_canceled is False and 'canceled' in title['status']:
+                logger.info("{} was rejected as it is a canceled tv show".format(title['title']))
+                return False
+
+        if item_type == "shows":
+            if config.filters_allow_returning is False and 'returning' in title['status']:
+                logger.info("{} was rejected as it is a returning tv show".format(title['title']))
+                return False
+
+        logger.debug("Checking rating: {}".format(title['rating']))
+        if float(title['rating']) < float(config.filters_rating):
+            logger.info("{} was rejected as it was outside the allowed ratings: {}".format(title['title'], str(title['rating'])))
+            return False
+
+        logger.debug("Checking genres: {}".format(title['genres']))
+        if isinstance(config.filters_genre, list):
+            if old_check_lists(config.filters_genre, title['genres']):
+                logger.info("{} was rejected as it wasn't a wanted genre: {}".format(title['title'], str(title['genres'])))
+                return False
+        elif title['genres'] in config.filters_genre:
+            logger.info("{} was rejected as it wasn't a wanted genre: {}".format(title['title'], str(title['genres'])))
+            return False
+
+        logger.debug("Checking country: {}".format(country))
+        if country and country not in config.filters_country:
+            logger.info("{} was rejected as it wasn't a wanted country: {}".format(title['title'],
+                                                                                   str(title['country'])))
+            return False
+
+        logger.debug("Checking language: {}".format(lang))
+        if lang not in config.filters_language:
+            logger.info("{} was rejected as it wasn't a wanted language: {}".format(title['title'], lang))
+        return True
+    else:
+        logger.info("{} was rejected as it is already in {} library".format(title['title'], item_type))
+        return False
+
+
+def old_filter(titles, library):
+    """Check titles like filter_list did with the old filter_check, returns the number passed"""
+    passed = 0
+    for title in titles:
+        try:
+            if old_filter_check(title, 'shows', library):
+                passed += 1
+        except TypeError:
+            logger.debug('{} failed to check against filters'.format(title['title']))
+    return passed
+
+
+def micro(n, merge_sizes=(1000, 10000, 50000), merge_baseline_max=10000):
+    """Benchmarks of single stages on n titles, the list merge is timed at each of merge_sizes
+
+    The old merge is quadratic, it is only timed up to merge_baseline_max titles per list."""
+    from lib import batch, filters, library, logs, media, sodarr
+    import Pingrr
+
+    results = {}
+    series = [{'id': i, 'tvdbId': i, 'title': 'Show %d' % i, 'path': '/tv/%d' % i, 'tags': [1],
+               'seasons': [{'seasonNumber': s, 'monitored': True} for s in range(5)]} for i in range(n)]
+    body = json.dumps(series).encode('utf-8')
+
+    def whole():
+        library.LibraryIndex('sonarr').extend(json.loads(body.decode('utf-8')))
+
+    def streamed():
+        chunks = (body[i:i + sodarr.CHUNK_SIZE] for i in range(0, len(body), sodarr.CHUNK_SIZE))
+        library.LibraryIndex('sonarr').extend(sodarr.iter_json_array(chunks))
+
+    results['library_json'] = {'seconds': timed(whole)[0], 'peak_mb': traced(whole)}
+    results['library_streamed'] = {'seconds': timed(streamed)[0], 'peak_mb': traced(streamed)}
+
+    for size in merge_sizes:
+        results['merge_%d' % size] = merge(size, size <= merge_baseline_max)
+
+    titles = [media.from_trakt('show', trakt_title(i, False)) for i in range(n)]
+    pipeline = filters.compile_filters('shows')
+
+    class Undecided(object):
+        def known(self, title):
+            return None
+
+        def record(self, title, rule):
+            pass
+
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    devnull = open(os.devnull, 'w')
+    sink = logging.StreamHandler(devnull)
+    sink.setFormatter(handlers[0].formatter if handlers else None)
+    root.handlers = [sink]
+    # the old filter_check against the compiled pipeline, on dict titles and a library holding every other title
+    dicts = [title.to_dict() for title in titles]
+    index = library.LibraryIndex('sonarr')
+    for i in range(0, n, 2):
+        index.add({'id': i + 1, 'tvdb': i, 'tmdb': None, 'imdb': None, 'title': '', 'path': '', 'tags': [], 'added': None})
+    compiled = filters.compile_filters('shows', index)
+    try:
+        for name in ('DEBUG', 'INFO', 'WARNING'):
+            root.setLevel(name)
+            seconds = timed(lambda: sum(1 for _ in Pingrr.check_titles(titles, pipeline, Undecided(), logs.Rejections())))[0]
+            results['filter_' + name.lower()] = {'seconds': seconds, 'titles_per_second': n / seconds}
+            seconds, passed = timed(lambda: sum(passed for title, passed in Pingrr.check_titles(
+                dicts, compiled, Undecided(), logs.Rejections())))
+            baseline, baseline_passed = timed(old_filter, dicts, index)
+            results['filter_old_' + name.lower()] = {'seconds': seconds, 'baseline_seconds': baseline,
+                                                     'speedup': baseline / seconds, 'passed': passed,
+                                                     'baseline_passed': baseline_passed}
+    finally:
+        root.handlers, root.level = handlers, level
+        devnull.close()
+
+    per_title = timed(lambda: [pipeline.check(title) for title in titles])
+    results['filter_per_title'] = {'seconds': per_title[0]}
+    if batch.numpy is not None:
+        batched = timed(batch.check_batch, pipeline, titles)
+        results['filter_batch'] = {'seconds': batched[0], 'parity': batched[1] == per_title[1]}
+
+    # decoded like a trakt response, so repeated strings are separate objects
+    objs = json.loads(json.dumps([trakt_title(i, False) for i in range(n)]))
+    as_dicts = lambda: [{'title': obj['title'], 'status': obj['status'], 'tvdb': obj['ids']['tvdb'],
+                         'imdb': obj['ids']['imdb'], 'trakt': obj['ids']['trakt'], 'rating': obj['rating'],
+                         'language': obj['language'], 'country': obj['country'], 'genres': obj['genres'],
+                         'network': obj['network'], 'votes': obj['votes'], 'runtime': obj['runtime'],
+                         'year': obj['year'], 'aired': obj['aired_episodes']} for obj in objs]
+    as_records = lambda: [media.from_trakt('show', obj) for obj in objs]
+    for name, build in (('dicts', as_dicts), ('records', as_records)):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results['memory_' + name] = {'bytes_per_title': size / float(len(kept))}
+        del kept
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pingrr offline against replayed trakt, sonarr and radarr")
+    parser.add_argument('--sizes', default='1000x100,10000x1000',
+                        help="comma separated <library titles>x<titles per trakt list> for synthetic runs")
+    parser.add_argument('--fixtures', help="replay a file recorded with record_http instead of synthetic data")
+    parser.add_argument('--latency', type=float, default=0, help="milliseconds the replay servers wait per request")
+    parser.add_argument('--micro', type=int, metavar='N', help="run the single stage benchmarks on N titles")
+    parser.add_argument('--merge-sizes', default='1000,10000,50000',
+                        help="comma separated titles per trakt list for the --micro merge benchmark")
+    parser.add_argument('--merge-baseline-max', type=int, default=10000,
+                        help="largest list size the quadratic pre-change merge is timed at")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='pingrr-benchmark-')
+    config.log_folder = folder
+    config.log_level = 'WARNING'
+    results = {}
+    try:
+        if args.micro:
+            results['micro'] = micro(args.micro, [int(size) for size in args.merge_sizes.split(',')],
+                                     args.merge_baseline_max)
+        elif args.fixtures:
+            from lib import replay
+            results['fixtures'] = run_pipeline(replay.load(args.fixtures), args.latency / 1000.0, folder)
+        else:
+            # synthetic trakt lists are served in pages of PAGE_SIZE
+            config.trakt_limit = PAGE_SIZE
+            for n, size in enumerate(args.sizes.split(',')):
+                library_size, list_size = [int(value) for value in size.split('x')]
+                # a size may be given more than once, each run starts from an empty data folder
+                run_folder = tempfile.mkdtemp(prefix=size + '-', dir=folder)
+                name = size if size not in results else '{} (run {})'.format(size, n + 1)
+                results[name] = run_pipeline(synthetic(library_size, list_size), args.latency / 1000.0, run_folder,
+                                             list_size, True)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    for name, result in sorted(results.get('micro', results).items()):
+        print("{:<20} {}".format(name, ", ".join("{}={}".format(key, round(value, 4) if isinstance(value, float) else value)
+                                                for key, value in sorted(result.items()))))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
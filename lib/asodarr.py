@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+import config
+from lib import library
+from lib import session
+from lib import sodarr
+from lib import stats
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+def available():
+    return aiohttp is not None
+
+
+class Response(object):
+    """The parts of an aiohttp answer that session.response_hooks read, named like a requests response"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class AsyncAPI(object):
+    """asyncio counterpart of sodarr.API, which stays the synchronous client
+
+    Requests share one aiohttp connection pool and the per-host token bucket of lib.session.
+    Use it as an async context manager so the pool is closed."""
+
+    def __init__(self, host_url, api_key):
+        if aiohttp is None:
+            raise RuntimeError("the asyncio sonarr/radarr client needs aiohttp installed")
+        self.host_url = host_url
+        self.api_key = api_key
+        self.host = urlsplit(host_url).netloc
+        self.slots = asyncio.Semaphore(getattr(config, 'http_max_concurrency', 4))
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def get_session(self):
+        if self.session is None:
+            pool_size = getattr(config, 'http_pool_size', 10)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size),
+                timeout=aiohttp.ClientTimeout(total=getattr(config, 'http_timeout', 60)),
+                headers={'X-Api-Key': self.api_key})
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def send(self, method, url, read, data=None, headers=None, timeout=None, streamed=False):
+        """Send a request and return what read(res) makes of the answer, retrying 429 answers like lib.session
+
+        read returns (result, body), every answer is recorded in the run stats and passed to
+        session.response_hooks like the answers of the synchronous client. The body of a streamed
+        answer is counted by its reader with stats.add_bytes, read only returns it for the hooks."""
+        limiter = session.get_limiter(self.host)
+        retries = getattr(config, 'http_retries', 3)
+        attempt = 0
+        while True:
+            await asyncio.sleep(limiter.reserve())
+            async with self.slots:
+                start = time.monotonic()
+                async with self.get_session().request(method, url, json=data, headers=headers, timeout=timeout) as res:
+                    retrying = res.status == 429 and attempt < retries
+                    if retrying:
+                        result, body = None, await res.read()
+                        delay = session.retry_after(res)
+                    else:
+                        result, body = await read(res)
+                    stats.record_http(url, res.status, 0 if streamed else len(body or b''), time.monotonic() - start,
+                                      1 if retrying else 0)
+                    for hook in session.response_hooks:
+                        hook(method, url, Response(res.status, res.headers, body or b''))
+            if not retrying:
+                return result
+            if delay is None:
+                delay = session.backoff(attempt)
+            logger.warning("{} asked to slow down, retrying {} in {:.1f}s".format(self.host, urlsplit(url).path, delay))
+            limiter.pause(delay)
+            attempt += 1
+
+    async def request(self, method, path, data=None):
+        """Send a request and return the decoded JSON, a 401 raises sodarr.Unauthorized"""
+        async def read(res):
+            body = await res.read()
+            return (res.status, json.loads(body.decode('utf-8')) if body.strip() else None), body
+
+        status, result = await self.send(method, self.host_url + path, read, data)
+        if status == 401:
+            raise sodarr.Unauthorized("{} answered 401 unauthorised, check api/url".format(self.host_url))
+        return result
+
+    # ENDPOINT CALENDAR
+    async def get_calendar(self):
+        return await self.request('GET', '/calendar')
+
+    # ENDPOINT COMMAND
+    async def command(self, command_json):
+        return await self.request('POST', '/command', command_json)
+
+    # ENDPOINT EPISODE
+    async def get_episodes_by_series_id(self, series_id):
+        return await self.request('GET', '/episode?seriesId={}'.format(series_id))
+
+    async def get_episode_by_episode_id(self, episode_id):
+        return await self.request('GET', '/episode/{}'.format(episode_id))
+
+    # ENDPOINT QUEUE
+    async def get_queue(self):
+        return await self.request('GET', '/queue')
+
+    # ENDPOINT PROFILE
+    async def get_quality_profiles(self):
+        return await self.request('GET', '/qualityprofile')
+
+    # ENDPOINT TAG
+    async def get_tags(self):
+        return await self.request('GET', '/tag')
+
+    # ENDPOINT ROOTFOLDER
+    async def get_root_folder(self):
+        return await self.request('GET', '/rootfolder')
+
+    # ENDPOINT SERIES
+    async def get_series(self):
+        return await self.request('GET', '/series')
+
+    async def get_series_by_series_id(self, series_id):
+        return await self.request('GET', '/series/{}'.format(series_id))
+
+    async def add_series(self, series_json):
+        return await self.request('POST', '/series', series_json)
+
+    async def lookup_series(self, query):
+        return await self.request('GET', '/series/lookup?term={}'.format(query))
+
+    # ENDPOINT MOVIE
+    async def get_movies(self):
+        return await self.request('GET', '/movie')
+
+    async def add_movie(self, movie_json):
+        return await self.request('POST', '/movie', movie_json)
+
+    async def lookup_movie(self, query):
+        return await self.request('GET', '/movie/lookup?term={}'.format(query))
+
+    async def get_library(self, program, index=None, name=None):
+        """Stream the whole library into a LibraryIndex, like sodarr.get_library
+
+        A saved index passed in is kept as is when sonarr/radarr answers that nothing changed, a 401
+        raises sodarr.Unauthorized."""
+        url = self.host_url + '/' + sodarr.ENDPOINTS[program]
+        headers = {}
+        if index is not None:
+            if index.etag:
+                headers['If-None-Match'] = index.etag
+            if index.last_modified:
+                headers['If-Modified-Since'] = index.last_modified
+        # a large library takes longer than http_timeout, only a stalled read fails it
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=getattr(config, 'http_timeout', 60))
+
+        async def read(res):
+            if res.status != 200:
+                return (res.status, None), await res.read()
+            downloaded = library.LibraryIndex(program, name)
+            parser = sodarr.JsonArrayParser()
+            # the whole body is only kept when a response hook such as the recorder wants it
+            body = [] if session.response_hooks else None
+            async for chunk in res.content.iter_chunked(sodarr.CHUNK_SIZE):
+                stats.add_bytes(url, len(chunk))
+                if body is not None:
+                    body.append(chunk)
+                for item in parser.feed(chunk):
+                    downloaded.add(library.from_arr(item))
+            parser.close()
+            downloaded.etag = res.headers.get('ETag')
+            downloaded.last_modified = res.headers.get('Last-Modified')
+            downloaded.refreshed()
+            return (res.status, downloaded), b''.join(body or ())
+
+        status, downloaded = await self.send('GET', url, read, headers=headers, timeout=timeout, streamed=True)
+        if status == 401:
+            raise sodarr.Unauthorized("{} answered 401 unauthorised, check api/url".format(name or program))
+        if status == 304 and index is not None:
+            logger.debug("{} library not modified since last sync".format(program))
+            index.refreshed()
+            return index
+        if downloaded is None:
+            raise requests.exceptions.HTTPError("{} library answered {}".format(name or program, status))
+        return downloaded
+
+    async def bulk_add(self, program, payloads):
+        """Add series/movies concurrently, returns results in the format of sodarr.bulk_add"""
+        add = self.add_movie if program == 'radarr' else self.add_series
+
+        async def submit(payload):
+            try:
+                return sodarr.add_result(await add(payload))
+            except Exception as e:
+                return sodarr.add_result(None, e)
+
+        return list(await asyncio.gather(*[submit(payload) for payload in payloads]))
+
+
+def get_library(program, host, api_key, endpoint, index=None, name=None):
+    """Synchronous entry point to AsyncAPI.get_library, a drop in for sodarr.get_library in sodarr.sync_library
+
+    Timeouts and connection errors are raised as their requests counterparts, so callers handle both
+    clients the same way."""
+    async def run():
+        async with AsyncAPI(host + '/api/v3', api_key) as api:
+            return await api.get_library(program, index, name)
+    try:
+        index = asyncio.run(run())
+    except asyncio.TimeoutError as e:
+        raise requests.exceptions.ReadTimeout("{} library timed out: {}".format(name or program, e))
+    except aiohttp.ClientError as e:
+        raise requests.exceptions.ConnectionError("{} library: {}".format(name or program, e))
+    index.persist()
+    return index
+
+
+def bulk_add(host_url, api_key, program, payloads):
+    """Synchronous entry point running AsyncAPI.bulk_add in its own event loop"""
+    async def run():
+        async with AsyncAPI(host_url, api_key) as api:
+            return await api.bulk_add(program, payloads)
+    return asyncio.run(run())
@@ -0,0 +1,151 @@
+import logging
+from itertools import islice
+from operator import attrgetter, itemgetter
+
+from lib import filters
+from lib import library
+from lib import logs
+from lib import media
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# What one rule made of a title: passed, failed, or raised TypeError like pipeline.check would
+PASS, FAIL, ERROR = 1, 0, -1
+# Field types numpy compares exactly as the numeric rules do, None becomes NaN and fails
+NUMERIC = frozenset([int, float, bool, type(None)])
+
+
+def as_array(titles):
+    """Object array of the titles, so the titles still passing can be taken out by index"""
+    try:
+        return numpy.fromiter(titles, dtype=object, count=len(titles))
+    except (TypeError, ValueError):
+        # numpy < 1.23
+        array = numpy.empty(len(titles), dtype=object)
+        for i, title in enumerate(titles):
+            array[i] = title
+        return array
+
+
+def getter(kinds, field):
+    """Reader of a field for titles of the given types, an attrgetter avoids a Python call per Movie/Show record"""
+    if all(issubclass(kind, media.Record) and field in kind.KEYS for kind in kinds):
+        return attrgetter(field)
+    return itemgetter(field)
+
+
+def values(titles, field, kinds):
+    """List of a field of every title"""
+    return list(map(getter(kinds, field), titles))
+
+
+def each(passes, titles):
+    """Codes of a rule checked one title at a time, for values the vectorised paths can not take"""
+    codes = numpy.empty(len(titles), dtype=numpy.int8)
+    for i, title in enumerate(titles):
+        try:
+            codes[i] = PASS if passes(title) else FAIL
+        except TypeError:
+            codes[i] = ERROR
+    return codes
+
+
+def numeric(titles, kinds, field, minimum, passes):
+    """Codes of a minimum rule, compared as one float column"""
+    column = values(titles, field, kinds)
+    if not NUMERIC.issuperset(map(type, column)):
+        # strings and other types behave differently in pipeline.check
+        return each(passes, titles)
+    return (numpy.array(column, dtype=float) >= minimum).astype(numpy.int8)
+
+
+def categorical(titles, kinds, field, passes):
+    """Codes of a single field rule, checked once per distinct value and spread over the titles"""
+    column = values(titles, field, kinds)
+    try:
+        lookup = dict.fromkeys(column)
+    except TypeError:
+        # unhashable values such as genre lists
+        return each(passes, titles)
+    for value in lookup:
+        try:
+            lookup[value] = PASS if passes({field: value}) else FAIL
+        except TypeError:
+            lookup[value] = ERROR
+    try:
+        return numpy.fromiter(map(lookup.__getitem__, column), dtype=numpy.int8, count=len(column))
+    except KeyError:
+        # NaN is not equal to itself
+        return each(passes, titles)
+
+
+def in_library(titles, kinds, pipeline, passes):
+    """Codes of the library rule, one id lookup per title"""
+    known = pipeline.library.ids() if isinstance(pipeline.library, library.LibraryIndex) else pipeline.library
+    ids = values(titles, pipeline.type_id, kinds)
+    try:
+        found = numpy.fromiter(map(known.__contains__, ids), dtype=bool, count=len(ids))
+    except TypeError:
+        return each(passes, titles)
+    return (~found).astype(numpy.int8)
+
+
+def rule_codes(pipeline, rule, passes, titles, kinds):
+    """PASS/FAIL/ERROR of one rule of the pipeline for each title, kinds are the types of the titles"""
+    if rule in pipeline.minimums:
+        field, minimum = pipeline.minimums[rule]
+        return numeric(titles, kinds, field, minimum, passes)
+    if rule == 'library':
+        return in_library(titles, kinds, pipeline, passes)
+    return categorical(titles, kinds, filters.REASONS[rule][0] or 'status', passes)
+
+
+def checked(pipeline, title):
+    try:
+        return pipeline.check(title)
+    except TypeError:
+        return None
+
+
+def check_batch(pipeline, titles):
+    """Check a batch of titles, returns (passed, rule) per title exactly as pipeline.check would
+
+    A title pipeline.check raises TypeError on gets None. Each rule is evaluated for the titles
+    still passing only, so a title stops at its first failed rule as it does per title."""
+    if numpy is None or not titles:
+        return [checked(pipeline, title) for title in titles]
+
+    # outcome of each title: the index of the rule it failed, len(rules) when it passed, len(rules) + 1 on TypeError
+    rules = pipeline.rules
+    outcomes = numpy.full(len(titles), len(rules), dtype=numpy.intp)
+    array = as_array(titles)
+    kinds = set(map(type, titles))
+    remaining = numpy.arange(len(titles))
+    for n, (rule, passes) in enumerate(rules):
+        if not len(remaining):
+            break
+        codes = rule_codes(pipeline, rule, passes, array[remaining], kinds)
+        outcomes[remaining[codes == FAIL]] = n
+        outcomes[remaining[codes == ERROR]] = len(rules) + 1
+        remaining = remaining[codes == PASS]
+    results = [(False, rule) for rule, passes in rules] + [(True, None), None]
+    return list(map(results.__getitem__, outcomes.tolist()))
+
+
+def iter_checked(pipeline, titles, batch_size):
+    """Yield (title, passed, rule) for an iterable of titles, checking batch_size titles at a time"""
+    titles = iter(titles)
+    while True:
+        chunk = list(islice(titles, batch_size))
+        if not chunk:
+            return
+        for title, result in zip(chunk, check_batch(pipeline, chunk)):
+            if result is None:
+                logger.debug(logs.Lazy('{} failed to check against filters', title['title']))
+                continue
+            yield title, result[0], result[1]
@@ -0,0 +1,150 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import config
+from lib import library
+from lib import replay
+from lib import session
+from lib import stats
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached trakt response is used without asking trakt again, by endpoint
+DEFAULT_TTL = {'anticipated': 3600, 'popular': 3600, 'trending': 900, 'search': 86400}
+# Response headers worth keeping with a cached body
+KEPT_HEADERS = ('ETag', 'X-Pagination-Page-Count', 'X-Pagination-Item-Count')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CachedResponse(object):
+    """The parts of a requests.Response that pingrr reads, rebuilt from the cache"""
+
+    def __init__(self, status_code, body, headers):
+        self.status_code = status_code
+        self.text = body
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache(object):
+    """Size bounded SQLite cache of GET responses, evicting the least recently used"""
+
+    def __init__(self, path, max_entries=2000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, endpoint TEXT, "
+                        "headers TEXT, body TEXT, stored REAL, used REAL)")
+        self.db.commit()
+
+    def lookup(self, url):
+        """Return (body, headers, stored) for a cached url, or None"""
+        with self.lock:
+            row = self.db.execute("SELECT body, headers, stored FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return row[0], json.loads(row[1]), row[2]
+
+    def store(self, url, endpoint, body, headers):
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (url, endpoint, json.dumps(headers), body, now, now))
+            self.db.commit()
+
+    def touch(self, url):
+        """Mark a cached response as fresh again, after trakt answered 304"""
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+
+    def get(self, url, endpoint, ttl, **kwargs):
+        """GET url, answering from the cache while the entry is younger than ttl seconds
+
+        Older entries are revalidated with If-None-Match when trakt gave an ETag. While HTTP is
+        recorded the cache is not read, so the fixture holds every trakt answer in full."""
+        entry = self.lookup(url) if ttl > 0 and not replay.recording() else None
+        if entry is not None:
+            body, headers, stored = entry
+            if time.time() - stored < ttl:
+                self.hits += 1
+                stats.count('cache.hit')
+                return CachedResponse(200, body, headers)
+            if headers.get('ETag'):
+                kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'If-None-Match': headers['ETag']})
+
+        r = session.get(url, **kwargs)
+        if r.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            stats.count('cache.revalidated')
+            self.touch(url)
+            return CachedResponse(200, entry[0], entry[1])
+
+        self.misses += 1
+        stats.count('cache.miss')
+        if ttl > 0 and r.status_code == 200:
+            headers = dict((name, r.headers[name]) for name in KEPT_HEADERS if name in r.headers)
+            self.store(url, endpoint, r.text, headers)
+        return r
+
+    def evict(self):
+        """Drop the least recently used responses beyond max_entries"""
+        with self.lock:
+            self.db.execute("DELETE FROM responses WHERE url NOT IN "
+                            "(SELECT url FROM responses ORDER BY used DESC LIMIT ?)", (self.max_entries,))
+            self.db.commit()
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.db.close()
+
+    def log_stats(self):
+        total = self.hits + self.revalidated + self.misses
+        if total:
+            logger.info("trakt cache: {} hits, {} revalidated, {} misses ({:.0%} served from cache)".format(
+                self.hits, self.revalidated, self.misses, float(self.hits + self.revalidated) / total))
+
+
+def ttl(endpoint):
+    return getattr(config, 'trakt_cache_ttl', DEFAULT_TTL).get(endpoint, 0)
+
+
+def get_cache():
+    """Return the shared trakt response cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(library.data_file('pingrr.db'), getattr(config, 'trakt_cache_size', 2000))
+    return _cache
+
+
+def report():
+    """Log the cache counters and evict old entries, keeping the cache open"""
+    with _cache_lock:
+        if _cache is not None:
+            _cache.log_stats()
+            _cache.evict()
+
+
+def close():
+    """Log the cache counters, evict old entries and close the cache if it was used"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.log_stats()
+            _cache.close()
+            _cache = None
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from lib import library
+
+logger = logging.getLogger(__name__)
+
+# Title fields the filters look at, a change in any of them gets the title checked again
+FIELDS = ('year', 'runtime', 'votes', 'rating', 'status', 'language', 'country', 'network', 'genres')
+# Rejections not seen on a trakt list for this long are forgotten
+EXPIRY = 30 * 24 * 3600
+
+
+def digest(title, fingerprint):
+    """Hash of the filtered fields of a title and the filter configuration"""
+    values = [title.get(field) for field in FIELDS]
+    return hashlib.sha1(json.dumps([fingerprint, values], default=str).encode('utf-8')).hexdigest()[:20]
+
+
+class DecisionStore(object):
+    """Filter rejections for one sonarr/radarr instance, keyed by trakt id, kept between runs
+
+    A title is only skipped when neither its filtered fields nor the filters changed since it
+    was rejected. Library rejections are not kept, the library index answers those in O(1)."""
+
+    def __init__(self, scope, fingerprint, path=None):
+        """scope is the name of the instance whose filters made the decisions"""
+        self.scope = scope
+        self.fingerprint = fingerprint
+        self.path = path or library.data_file('pingrr.db')
+        self.rejected = {}
+        self.changed = {}
+        self.skipped = 0
+        self.load()
+
+    def load(self):
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute("CREATE TABLE IF NOT EXISTS decisions (scope TEXT, trakt INTEGER, digest TEXT, "
+                       "rule TEXT, seen REAL, PRIMARY KEY (scope, trakt))")
+            if 'item_type' in [column[1] for column in db.execute("PRAGMA table_info(decisions)")]:
+                # the column has held instance names since decisions were kept per instance
+                db.execute("ALTER TABLE decisions RENAME COLUMN item_type TO scope")
+            db.execute("DELETE FROM decisions WHERE seen < ?", (time.time() - EXPIRY,))
+            db.commit()
+            rows = db.execute("SELECT trakt, digest, rule FROM decisions WHERE scope = ?", (self.scope,))
+            self.rejected = dict((trakt, (title_digest, rule)) for trakt, title_digest, rule in rows)
+        finally:
+            db.close()
+        logger.debug("loaded {} known {} rejections".format(len(self.rejected), self.scope))
+
+    def known(self, title):
+        """Return the rule that rejected an unchanged title before, or None if it needs checking"""
+        decision = self.rejected.get(title['trakt'])
+        if decision is None or decision[0] != digest(title, self.fingerprint):
+            return None
+        self.skipped += 1
+        self.changed[title['trakt']] = decision
+        return decision[1]
+
+    def record(self, title, rule):
+        """Remember the outcome of checking a title, rule is None when it passed"""
+        if rule is None or rule == 'library':
+            if self.rejected.pop(title['trakt'], None) is not None:
+                self.changed[title['trakt']] = None
+            return
+        decision = (digest(title, self.fingerprint), rule)
+        self.rejected[title['trakt']] = decision
+        self.changed[title['trakt']] = decision
+
+    def save(self):
+        if not self.changed:
+            return
+        now = time.time()
+        db = sqlite3.connect(self.path)
+        try:
+            db.executemany("DELETE FROM decisions WHERE scope = ? AND trakt = ?",
+                           [(self.scope, trakt) for trakt, decision in self.changed.items() if decision is None])
+            db.executemany("INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?)",
+                           [(self.scope, trakt, decision[0], decision[1], now)
+                            for trakt, decision in self.changed.items() if decision is not None])
+            db.commit()
+        finally:
+            db.close()
+        self.changed = {}
+        if self.skipped:
+            logger.info("skipped {} titles {} rejected before and unchanged since".format(self.skipped, self.scope))
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Why a title was rejected, by rule: (title field shown, reason)
+REASONS = {'library': (None, "it is already in the library"),
+           'year': ('year', "it was outside allowed year range"),
+           'runtime': ('runtime', "it was outside allowed runtime"),
+           'votes': ('votes', "it did not meet vote requirement"),
+           'rating': ('rating', "it was outside the allowed ratings"),
+           'ended': (None, "it is an ended tv series"),
+           'canceled': (None, "it is a canceled tv show"),
+           'returning': (None, "it is a returning tv show"),
+           'language': ('language', "it wasn't a wanted language"),
+           'country': ('country', "it wasn't a wanted country"),
+           'network': ('network', "it was by a disallowed network"),
+           'genre': ('genres', "it wasn't a wanted genre")}
+
+
+# filters_<name> settings the rules are built from, settings such as filters_batch_size only change
+# how titles are checked and are left out of the fingerprint
+RULE_SETTINGS = ('year', 'runtime', 'votes', 'rating', 'allow_ended', 'allow_canceled', 'allow_returning',
+                 'language', 'country', 'network', 'genre')
+
+
+def to_set(values, lower=False):
+    """Turn a filter list, or a comma separated string, into a frozenset"""
+    if values is None:
+        values = []
+    elif isinstance(values, str):
+        values = [value.strip() for value in values.split(',')]
+    if lower:
+        values = [value.lower() for value in values]
+    return frozenset(values)
+
+
+def config_setting(name):
+    return getattr(config, 'filters_' + name)
+
+
+def fingerprint(item_type, setting=config_setting):
+    """Hash of the filter settings that decide which titles pass, for an item type"""
+    settings = {}
+    for name in RULE_SETTINGS:
+        try:
+            settings[name] = setting(name)
+        except AttributeError:
+            settings[name] = None
+    return hashlib.sha1(json.dumps([item_type, settings], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def describe(rule, title):
+    """Return the log text for a title rejected by rule"""
+    field, reason = REASONS[rule]
+    if field is None:
+        return reason
+    return "{}: {}".format(reason, title[field])
+
+
+class Pipeline(object):
+    """The filters of one item type, compiled into predicates ordered cheapest first
+
+    check() stops at the first predicate a title fails and returns (False, rule), or
+    (True, None) when the title passes every filter."""
+
+    def __init__(self, item_type, library=None, setting=config_setting):
+        """setting(name) returns the value of filters_<name>, by default from config"""
+        self.item_type = item_type
+        self.fingerprint = fingerprint(item_type, setting)
+        self.rules = []
+        shows = item_type == 'shows'
+        self.type_id = 'tvdb' if shows else 'tmdb'
+        self.library = library
+
+        if library is not None:
+            type_id = self.type_id
+            self.add('library', lambda t: t[type_id] not in library)
+
+        min_year = setting('year')[item_type]
+        min_runtime = setting('runtime')
+        min_votes = setting('votes')
+        min_rating = float(setting('rating'))
+        # numeric rules, rule: (field, minimum), for batch evaluation
+        self.minimums = {'year': ('year', min_year),
+                         'runtime': ('runtime', min_runtime),
+                         'votes': ('votes', min_votes),
+                         'rating': ('rating', min_rating)}
+        self.add('year', lambda t: t['year'] is not None and t['year'] >= min_year)
+        self.add('runtime', lambda t: t['runtime'] is not None and t['runtime'] >= min_runtime)
+        self.add('votes', lambda t: t['votes'] is not None and t['votes'] >= min_votes)
+        self.add('rating', lambda t: t['rating'] is not None and float(t['rating']) >= min_rating)
+
+        if shows:
+            if setting('allow_ended') is False:
+                self.add('ended', lambda t: 'ended' not in (t['status'] or ''))
+            if setting('allow_canceled') is False:
+                self.add('canceled', lambda t: 'canceled' not in (t['status'] or ''))
+            if setting('allow_returning') is False:
+                self.add('returning', lambda t: 'returning' not in (t['status'] or ''))
+
+        languages = to_set(setting('language'))
+        self.add('language', lambda t: t['language'] in languages)
+
+        if shows:
+            countries = to_set(setting('country'), lower=True)
+            self.add('country', lambda t: not t['country'] or t['country'].lower() in countries)
+
+            networks = to_set(setting('network'))
+            if networks:
+                self.add('network', lambda t: t['network'] is not None and t['network'] not in networks)
+
+        genres = to_set(setting('genre'))
+        self.add('genre', lambda t: genres.isdisjoint(t['genres'] or ()))
+
+    def add(self, rule, passes):
+        self.rules.append((rule, passes))
+
+    def check(self, title):
+        for rule, passes in self.rules:
+            if not passes(title):
+                return False, rule
+        return True, None
+
+
+def compile_filters(item_type, library=None, setting=config_setting):
+    pipeline = Pipeline(item_type, library, setting)
+    logger.debug("compiled {} filters: {}".format(item_type, ", ".join(rule for rule, passes in pipeline.rules)))
+    return pipeline
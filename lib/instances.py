@@ -0,0 +1,103 @@
+import logging
+
+import config
+from lib import replay
+from lib import sodarr
+
+logger = logging.getLogger(__name__)
+
+# settings of an instance and the single-instance config key they default to
+SETTINGS = {'sonarr': {'host': 'sonarr_host',
+                       'api': 'sonarr_api',
+                       'quality_profile': 'sonarr_quality_profile',
+                       'path_root': 'sonarr_path_root',
+                       'tag_id': 'sonarr_tag_id',
+                       'monitored': 'sonarr_monitored',
+                       'search': 'sonarr_search_missing_episodes',
+                       'add_budget_run': 'add_budget_run',
+                       'add_budget_day': 'add_budget_day'},
+            'radarr': {'host': 'radarr_host',
+                       'api': 'radarr_api',
+                       'quality_profile': 'radarr_quality_profile',
+                       'path_root': 'radarr_path_root',
+                       'tag_id': 'radarr_tag_id',
+                       'monitored': 'radarr_monitored',
+                       'search': 'radarr_search',
+                       'minimum_availability': 'radarr_minimumAvailability',
+                       'add_budget_run': 'add_budget_run',
+                       'add_budget_day': 'add_budget_day'}}
+
+_instances = {}
+
+
+class Instance(object):
+    """A sonarr or radarr server, with its own add settings, filters and library index"""
+
+    def __init__(self, program, settings):
+        self.program = program
+        self.item_type = 'movies' if program == 'radarr' else 'shows'
+        self.name = settings.get('name', program)
+        self.settings = {}
+        for key, config_key in SETTINGS[program].items():
+            self.settings[key] = settings[key] if key in settings else getattr(config, config_key, None)
+        self.host = self.settings['host']
+        self.api_key = self.settings['api']
+        self.filters = settings.get('filters', {})
+        self.api = sodarr.API(self.host + '/api/v3', self.api_key)
+        self.library = None
+        self.resolved = {}
+
+    def __getitem__(self, key):
+        if key in self.resolved:
+            return self.resolved[key]
+        return self.settings[key]
+
+    def resolve(self):
+        """Turn quality profile, root folder and tag names into what sonarr/radarr expects
+
+        Raises metadata.UnknownSetting when one of them does not exist, so a misconfigured instance is skipped
+        before any title is checked."""
+        resolver = self.api.metadata
+        # fetched again while HTTP is recorded, so the fixture holds them even when the cache is fresh
+        resolver.refresh(force=replay.recording())
+        self.resolved = {'quality_profile': resolver.profile_id(self.settings['quality_profile']),
+                         'path_root': resolver.root_folder(self.settings['path_root']),
+                         'tag_id': resolver.tag_id(self.settings['tag_id'])}
+        logger.debug("{} resolved {}".format(self.name, self.resolved))
+
+    def filter_setting(self, name):
+        """Value of filters_<name> for this instance, its own filters override config"""
+        if name in self.filters:
+            return self.filters[name]
+        return getattr(config, 'filters_' + name)
+
+    def __repr__(self):
+        return "{}({})".format(self.program, self.name)
+
+
+def load(program):
+    """Return the configured instances of sonarr or radarr, built once and reused
+
+    sonarr_instances/radarr_instances list one dict per instance with a unique name, settings
+    missing from a dict fall back to the single-instance sonarr_*/radarr_* config."""
+    if program not in _instances:
+        listed = getattr(config, program + '_instances', None)
+        if listed:
+            _instances[program] = [Instance(program, settings) for settings in listed]
+        elif getattr(config, program + '_api', None):
+            _instances[program] = [Instance(program, {})]
+        else:
+            _instances[program] = []
+        names = [instance.name for instance in _instances[program]]
+        if len(set(names)) != len(names):
+            raise ValueError("{} instances need unique names, got {}".format(program, names))
+    return _instances[program]
+
+
+def find(name):
+    """Return the instance with the given name, or None"""
+    for program in ('sonarr', 'radarr'):
+        for instance in load(program):
+            if instance.name == name:
+                return instance
+    return None
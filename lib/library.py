@@ -0,0 +1,151 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('id', 'tvdb', 'tmdb', 'imdb', 'title', 'path', 'tags', 'added')
+KEYS = ('tvdb', 'tmdb', 'imdb')
+FORMAT_VERSION = 1
+
+
+def data_file(name):
+    """Return the path of a pingrr state file, next to the logs unless data_folder is set"""
+    folder = getattr(config, 'data_folder', '') or config.log_folder or '.'
+    return os.path.join(folder, name)
+
+
+def from_arr(item):
+    """Build an index record from a sonarr series or radarr movie object"""
+    return {'id': item.get('id'),
+            'tvdb': item.get('tvdbId') or None,
+            'tmdb': item.get('tmdbId') or None,
+            'imdb': item.get('imdbId') or None,
+            'title': item.get('title'),
+            'path': item.get('path') or item.get('folderPath'),
+            'tags': item.get('tags') or [],
+            'added': item.get('added')}
+
+
+class LibraryIndex(object):
+    """Library of a sonarr/radarr instance, indexed by tvdb, tmdb and imdb id"""
+
+    def __init__(self, program, name=None):
+        """name is the sonarr/radarr instance the index belongs to, program by default"""
+        self.program = program
+        self.name = name or program
+        self.primary = 'tmdb' if program == 'radarr' else 'tvdb'
+        self.items = {}
+        self.by_key = dict((key, {}) for key in KEYS)
+        self.updated = None
+        self.etag = None
+        self.last_modified = None
+        self.stale = False
+        # synced with sonarr/radarr while webhooks were received, and every webhook since applied
+        self.live = False
+        self.lock = threading.RLock()
+
+    def __contains__(self, value):
+        return value in self.by_key[self.primary]
+
+    def __len__(self):
+        return len(self.items)
+
+    def ids(self):
+        """Live view of the tvdb or tmdb ids in the index, for membership tests without a method call per id"""
+        return self.by_key[self.primary].keys()
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def add(self, record):
+        """Add or replace a record, keyed on its sonarr/radarr id"""
+        with self.lock:
+            if record['id'] in self.items:
+                self.remove(record['id'])
+            self.items[record['id']] = record
+            for key in KEYS:
+                if record[key]:
+                    self.by_key[key][record[key]] = record
+
+    def remove(self, arr_id):
+        with self.lock:
+            record = self.items.pop(arr_id, None)
+            if record is None:
+                return None
+            for key in KEYS:
+                if record[key] and self.by_key[key].get(record[key]) is record:
+                    del self.by_key[key][record[key]]
+            return record
+
+    def get(self, key, value):
+        """Look up a record by tvdb, tmdb or imdb id"""
+        return self.by_key[key].get(value)
+
+    def extend(self, items):
+        for item in items:
+            self.add(from_arr(item))
+        self.updated = time.time()
+        self.stale = False
+        return self
+
+    def refreshed(self):
+        """Mark a saved index as confirmed up to date by sonarr/radarr"""
+        self.updated = time.time()
+        self.stale = False
+
+    def save(self, path=None):
+        path = path or data_file('%s_library.json.gz' % self.name)
+        with self.lock:
+            items = [[record[field] for field in FIELDS] for record in self.items.values()]
+        payload = {'version': FORMAT_VERSION,
+                   'program': self.program,
+                   'updated': self.updated,
+                   'etag': self.etag,
+                   'last_modified': self.last_modified,
+                   'fields': FIELDS,
+                   'items': items}
+        temp = path + '.tmp'
+        with gzip.open(temp, 'wt') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(temp, path)
+        logger.debug("saved {} library index ({} items) to {}".format(self.name, len(self), path))
+
+    def persist(self):
+        """Save the index, logging rather than raising if it can not be written"""
+        try:
+            self.save()
+        except (IOError, OSError) as e:
+            logger.warning("Could not save {} library index: {}".format(self.name, e))
+
+    @classmethod
+    def load(cls, program, path=None, name=None):
+        """Load a saved index, returns None if there is no usable file"""
+        name = name or program
+        path = path or data_file('%s_library.json.gz' % name)
+        try:
+            with gzip.open(path, 'rt') as f:
+                payload = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            logger.debug("no saved {} library index loaded: {}".format(program, e))
+            return None
+
+        if payload.get('version') != FORMAT_VERSION or payload.get('program') != program:
+            logger.info("saved {} library index is from another version, ignoring it".format(program))
+            return None
+
+        index = cls(program, name)
+        fields = payload['fields']
+        for row in payload['items']:
+            index.add(dict(zip(fields, row)))
+        index.updated = payload['updated']
+        index.etag = payload.get('etag')
+        index.last_modified = payload.get('last_modified')
+        index.stale = True
+        logger.debug("loaded {} library index ({} items) from {}".format(program, len(index), path))
+        return index
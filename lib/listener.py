@@ -0,0 +1,155 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import config
+from lib import library
+from lib import metrics
+
+logger = logging.getLogger(__name__)
+
+# webhook events that carry a series/movie which is now in the library
+ADD_EVENTS = ('SeriesAdd', 'MovieAdded', 'Grab', 'Download', 'Rename')
+DELETE_EVENTS = ('SeriesDelete', 'MovieDelete')
+
+server = None
+_lock = threading.Lock()
+# (event, index it was applied to) by instance name, queued while that library is downloaded
+_refreshing = {}
+
+
+def handle_event(index, event):
+    """Apply a sonarr/radarr webhook event to a library index, returns what was done"""
+    event_type = event.get('eventType')
+    item = event.get('series') or event.get('movie')
+    if event_type == 'Test' or not isinstance(item, dict):
+        return 'ignored'
+    if event_type in DELETE_EVENTS:
+        record = index.remove(item.get('id'))
+        logger.info("webhook: {} removed from {} library".format(item.get('title'), index.program))
+        return 'removed' if record else 'unknown'
+    if event_type in ADD_EVENTS:
+        if item.get('id') not in index.items:
+            logger.info("webhook: {} added to {} library".format(item.get('title'), index.program))
+        index.add(library.from_arr(item))
+        return 'added'
+    return 'ignored'
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accepts sonarr/radarr webhooks on /webhook/<instance name>, e.g. /webhook/sonarr, and serves
+    Prometheus metrics on /metrics"""
+
+    def send_json(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/metrics' or not self.server.metrics:
+            return self.send_json(404, {'error': 'not found'})
+        data = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.server.get_index is None:
+            return self.send_json(404, {'error': 'not found'})
+        url = urlsplit(self.path)
+        token = getattr(config, 'webhook_token', '')
+        if token and parse_qs(url.query).get('token', [''])[0] != token:
+            return self.send_json(403, {'error': 'bad token'})
+
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'webhook':
+            return self.send_json(404, {'error': 'not found'})
+
+        try:
+            event = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        except ValueError:
+            return self.send_json(400, {'error': 'invalid json'})
+        if not isinstance(event, dict):
+            return self.send_json(400, {'error': 'expected a json object'})
+
+        name = parts[1]
+        with _lock:
+            index = self.server.get_index(name)
+            queued = name in _refreshing
+            if queued:
+                _refreshing[name].append((event, index))
+            result = handle_event(index, event) if index is not None else None
+        if result is not None:
+            return self.send_json(200, {'result': result})
+        if queued:
+            return self.send_json(200, {'result': 'queued'})
+        logger.debug("webhook: no {} library loaded yet, ignoring {}".format(name, event.get('eventType')))
+        self.send_json(200, {'result': 'not loaded'})
+
+    def log_message(self, format, *args):
+        logger.debug("webhook: " + format, *args)
+
+
+def start(get_index=None, serve_metrics=False):
+    """Start listening for webhooks and/or metrics scrapes in a background thread
+
+    get_index(name) returns the current library index of the named sonarr/radarr instance, without
+    it webhooks are refused."""
+    global server
+    address = (getattr(config, 'webhook_host', '0.0.0.0'), getattr(config, 'webhook_port', 5005))
+    server = ThreadingHTTPServer(address, WebhookHandler)
+    server.daemon_threads = True
+    server.get_index = get_index
+    server.metrics = serve_metrics
+    threading.Thread(target=server.serve_forever, name='webhook', daemon=True).start()
+    if get_index is not None:
+        logger.info("listening for sonarr/radarr webhooks on {}:{}".format(*address))
+    if serve_metrics:
+        logger.info("serving metrics on http://{}:{}/metrics".format(*address))
+    return server
+
+
+def begin_refresh(name):
+    """Queue the webhooks of an instance from now until end_refresh, returns False when webhooks are not received
+
+    Events arriving while a library is downloaded are applied to the index in use and replayed
+    onto the downloaded one, so none are lost when it replaces the old index."""
+    if not running():
+        return False
+    with _lock:
+        _refreshing[name] = []
+    return True
+
+
+def end_refresh(name, index):
+    """Replay the events queued since begin_refresh onto index, call it once index is the one get_index returns"""
+    with _lock:
+        events = _refreshing.pop(name, [])
+        for event, applied in events:
+            if index is not None and applied is not index:
+                handle_event(index, event)
+    if events:
+        logger.debug("webhook: replayed {} events received during the {} library sync".format(len(events), name))
+
+
+def running():
+    """True while webhooks are received, so library indexes held in memory stay current"""
+    return server is not None and server.get_index is not None
+
+
+def stop():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+_lock = threading.Lock()
+# (event, index it was applied to) by instance name, queued while that library is downloaded
+_refreshing = {}
@@ -0,0 +1,58 @@
+import logging
+import random
+
+import config
+
+# Titles named per rule in a rejection summary
+EXAMPLES = 3
+
+
+class Lazy(object):
+    """A log message formatted with str.format only if a handler emits it
+
+    logger.debug(Lazy("{} was checked", title['title'])) costs no formatting when debug is off."""
+
+    __slots__ = ('text', 'args')
+
+    def __init__(self, text, *args):
+        self.text = text
+        self.args = args
+
+    def __str__(self):
+        return self.text.format(*self.args)
+
+
+def sample_rate():
+    return getattr(config, 'log_sample_rate', 1.0)
+
+
+def sampled(rate=None):
+    """True for the share of per-title log lines kept by log_sample_rate, 1 keeps them all"""
+    rate = sample_rate() if rate is None else rate
+    return rate >= 1 or random.random() < rate
+
+
+class Rejections(object):
+    """Filter rejections of one pass counted by rule, logged as one summary line instead of a line per title"""
+
+    def __init__(self):
+        self.counts = {}
+        self.examples = {}
+
+    def add(self, title, rule):
+        self.counts[rule] = self.counts.get(rule, 0) + 1
+        examples = self.examples.setdefault(rule, [])
+        if len(examples) < EXAMPLES:
+            examples.append(title['title'])
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def log(self, logger, scope, level=logging.INFO):
+        if not self.counts or not logger.isEnabledFor(level):
+            return
+        parts = []
+        for rule, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            more = ", ..." if count > len(self.examples[rule]) else ""
+            parts.append("{} {} ({}{})".format(count, rule, ", ".join(self.examples[rule]), more))
+        logger.log(level, "{} rejected {} titles: {}".format(scope, self.total(), "; ".join(parts)))
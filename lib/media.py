@@ -0,0 +1,114 @@
+import sys
+
+# Shared tuples of interned genre names, most titles repeat a few dozen combinations
+_genres = {}
+
+
+def intern(value):
+    """Interned copy of a repeated string such as a language, country or network, None stays None"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_genres(genres):
+    """Genres as one shared tuple of interned names per distinct combination"""
+    if genres is None:
+        return None
+    genres = tuple(intern(genre) for genre in genres)
+    return _genres.setdefault(genres, genres)
+
+
+class Record(object):
+    """A trakt title with a fixed set of fields, read like the dicts it replaces
+
+    title['year'], title.get('year') and iterating over the field names all work, setting a field
+    that the type does not have raises KeyError."""
+
+    __slots__ = ()
+    FIELDS = ()
+    KEYS = frozenset()
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def get(self, key, default=None):
+        if key in self.KEYS:
+            return getattr(self, key)
+        return default
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.to_dict())
+
+
+class Movie(Record):
+    __slots__ = FIELDS = ('title', 'tmdb', 'imdb', 'trakt', 'rating', 'language', 'genres', 'votes', 'runtime',
+                          'certification', 'released', 'year', 'lists')
+    KEYS = frozenset(FIELDS)
+
+
+class Show(Record):
+    __slots__ = FIELDS = ('title', 'status', 'tvdb', 'imdb', 'trakt', 'rating', 'language', 'country', 'genres',
+                          'network', 'votes', 'runtime', 'year', 'aired', 'lists')
+    KEYS = frozenset(FIELDS)
+
+
+def from_trakt(kind, obj, rating=None, genres=None, votes=None):
+    """Normalise a trakt movie or show object into a Movie or Show
+
+    kind is 'movie' or 'show', rating, genres and votes replace trakt's when given (imdb info)."""
+    ids = obj['ids']
+    rating = obj['rating'] if rating is None else rating
+    genres = intern_genres(obj['genres'] if genres is None else genres)
+    votes = obj['votes'] if votes is None else votes
+    if kind == 'movie':
+        return Movie(title=obj['title'],
+                     tmdb=ids['tmdb'],
+                     imdb=ids['imdb'],
+                     trakt=ids['trakt'],
+                     rating=rating,
+                     language=intern(obj['language']),
+                     genres=genres,
+                     votes=votes,
+                     runtime=obj['runtime'],
+                     certification=intern(obj['certification']),
+                     released=obj['released'],
+                     year=obj['year'])
+    return Show(title=obj['title'],
+                status=intern(obj['status']),
+                tvdb=ids['tvdb'],
+                imdb=ids['imdb'],
+                trakt=ids['trakt'],
+                rating=rating,
+                language=intern(obj['language']),
+                country=intern(obj['country']),
+                genres=genres,
+                network=intern(obj['network']),
+                votes=votes,
+                runtime=obj['runtime'],
+                year=obj['year'],
+                aired=obj['aired_episodes'])
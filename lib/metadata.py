@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownSetting(ValueError):
+    """A configured quality profile, root folder or tag that sonarr/radarr does not have"""
+
+
+class Resolver(object):
+    """Quality profiles, root folders and tags of a sonarr/radarr server, cached for ttl seconds
+
+    Lets config refer to profiles and tags by name, and checks the configured values exist before
+    any title is sent."""
+
+    def __init__(self, api, ttl=None):
+        self.api = api
+        self.ttl = getattr(config, 'arr_metadata_ttl', 3600) if ttl is None else ttl
+        self.lock = threading.Lock()
+        self.fetched = None
+        self.profiles = []
+        self.folders = []
+        self.tags = []
+
+    def refresh(self, force=False):
+        """Fetch everything again if the cache is older than ttl"""
+        with self.lock:
+            if not force and self.fetched is not None and time.time() - self.fetched < self.ttl:
+                return
+            self.profiles = self.api.get_quality_profiles()
+            self.folders = self.api.get_root_folder()
+            self.tags = self.api.get_tags()
+            self.fetched = time.time()
+        logger.debug("fetched {} quality profiles, {} root folders and {} tags from {}".format(
+            len(self.profiles), len(self.folders), len(self.tags), self.api.host_url))
+
+    def quality_profiles(self):
+        self.refresh()
+        return self.profiles
+
+    def root_folders(self):
+        self.refresh()
+        return self.folders
+
+    def profile_id(self, value):
+        """Id of a quality profile given by id or by name"""
+        for profile in self.quality_profiles():
+            if profile['id'] == value or str(profile['name']).lower() == str(value).lower():
+                return profile['id']
+        raise UnknownSetting("quality profile {!r} not found, known profiles: {}".format(
+            value, ", ".join(profile['name'] for profile in self.profiles)))
+
+    def root_folder(self, value):
+        """Path of a root folder, the only one configured when value is empty"""
+        folders = self.root_folders()
+        if not value and len(folders) == 1:
+            value = folders[0]['path']
+        for folder in folders:
+            if folder['path'].rstrip('/\\') == str(value).rstrip('/\\'):
+                free = folder.get('freeSpace')
+                if free is not None:
+                    logger.info("root folder {} has {:.1f} GB free".format(folder['path'], free / 1024.0 ** 3))
+                return folder['path']
+        raise UnknownSetting("root folder {!r} not found, known folders: {}".format(
+            value, ", ".join(folder['path'] for folder in folders)))
+
+    def tag_id(self, value):
+        """Id of a tag given by id or by label, None stays None"""
+        if value is None or value == '':
+            return None
+        self.refresh()
+        for tag in self.tags:
+            if tag['id'] == value or str(tag['label']).lower() == str(value).lower():
+                return tag['id']
+        raise UnknownSetting("tag {!r} not found, known tags: {}".format(value, ", ".join(tag['label'] for tag in self.tags)))
@@ -0,0 +1,138 @@
+import threading
+
+# Upper bounds in seconds of the HTTP latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name: (type, help, label), run stats counters named <family>.<label value> are kept under their family
+METRICS = {'pingrr_http_request_duration_seconds': ('histogram', "Latency of HTTP calls by upstream host", 'host'),
+           'pingrr_http_requests_total': ('counter', "HTTP calls by upstream host and status", 'host'),
+           'pingrr_http_retries_total': ('counter', "HTTP retries by upstream host", 'host'),
+           'pingrr_http_response_bytes_total': ('counter', "Bytes received by upstream host", 'host'),
+           'pingrr_library_size': ('gauge', "Titles in the library index of a sonarr/radarr instance", 'instance'),
+           'pingrr_trakt_candidates_total': ('counter', "Titles fetched by trakt list", 'list'),
+           'pingrr_candidates_total': ('counter', "Titles checked against the filters by instance", 'instance'),
+           'pingrr_rejections_total': ('counter', "Titles rejected by filter rule", 'rule'),
+           'pingrr_added_total': ('counter', "Titles added by instance", 'instance'),
+           'pingrr_add_failures_total': ('counter', "Titles sonarr/radarr failed to add by instance", 'instance'),
+           'pingrr_cache_requests_total': ('counter', "Trakt cache lookups by result", 'result'),
+           'pingrr_cache_hit_ratio': ('gauge', "Share of trakt requests answered from the cache", None),
+           'pingrr_run_duration_seconds': ('gauge', "Duration of the last run", None),
+           'pingrr_last_run_timestamp_seconds': ('gauge', "When the last run finished", None)}
+
+# run stats counter family: metric
+FAMILIES = {'trakt_candidates': 'pingrr_trakt_candidates_total',
+            'candidates': 'pingrr_candidates_total',
+            'rejected': 'pingrr_rejections_total',
+            'added': 'pingrr_added_total',
+            'add_failed': 'pingrr_add_failures_total',
+            'library_size': 'pingrr_library_size',
+            'cache': 'pingrr_cache_requests_total'}
+
+_lock = threading.Lock()
+# (metric, label pairs): value, histograms hold [bucket counts..., sum, count]
+_values = {}
+
+
+def labels(metric, value, **extra):
+    label = METRICS[metric][2]
+    pairs = [(label, value)] if label else []
+    pairs.extend(sorted(extra.items()))
+    return tuple(pairs)
+
+
+def inc(metric, label=None, value=1, **extra):
+    key = (metric, labels(metric, label, **extra))
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(metric, value, label=None):
+    with _lock:
+        _values[(metric, labels(metric, label))] = value
+
+
+def observe(metric, value, label=None):
+    key = (metric, labels(metric, label))
+    with _lock:
+        buckets = _values.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        buckets[-2] += value
+        buckets[-1] += 1
+
+
+def record_http(host, status, size, elapsed, retries):
+    """Called by lib.stats for every HTTP call"""
+    observe('pingrr_http_request_duration_seconds', elapsed, host)
+    inc('pingrr_http_requests_total', host, status=str(status))
+    inc('pingrr_http_response_bytes_total', host, size)
+    if retries:
+        inc('pingrr_http_retries_total', host, retries)
+
+
+def add_bytes(host, size):
+    inc('pingrr_http_response_bytes_total', host, size)
+
+
+def record_count(name, value):
+    """Called by lib.stats for every counter, <family>.<label value>"""
+    family, _, label = name.partition('.')
+    metric = FAMILIES.get(family)
+    if metric is None:
+        return
+    if METRICS[metric][0] == 'gauge':
+        set_gauge(metric, value, label)
+    else:
+        inc(metric, label, value)
+    if family == 'cache':
+        update_hit_ratio()
+
+
+def update_hit_ratio():
+    with _lock:
+        counts = dict((key[1][0][1], value) for key, value in _values.items()
+                      if key[0] == 'pingrr_cache_requests_total')
+    total = sum(counts.values())
+    if total:
+        set_gauge('pingrr_cache_hit_ratio', float(counts.get('hit', 0) + counts.get('revalidated', 0)) / total)
+
+
+def record_run(duration, finished):
+    set_gauge('pingrr_run_duration_seconds', duration)
+    set_gauge('pingrr_last_run_timestamp_seconds', finished)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    with _lock:
+        values = sorted(_values.items(), key=lambda item: (item[0][0], item[0][1]))
+        values = [(key, list(value) if isinstance(value, list) else value) for key, value in values]
+
+    lines = []
+    for metric in sorted(METRICS):
+        kind, text, label = METRICS[metric]
+        samples = [(pairs, value) for (name, pairs), value in values if name == metric]
+        if not samples:
+            continue
+        lines.append('# HELP {} {}'.format(metric, text))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for pairs, value in samples:
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(metric, format_labels(pairs), value))
+                continue
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-2] + [value[-1]]):
+                lines.append('{}_bucket{} {}'.format(metric, format_labels(pairs + (('le', str(bound)),)), count))
+            lines.append('{}_sum{} {}'.format(metric, format_labels(pairs), value[-2]))
+            lines.append('{}_count{} {}'.format(metric, format_labels(pairs), value[-1]))
+    return '\n'.join(lines) + '\n'
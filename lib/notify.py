@@ -0,0 +1,197 @@
+import logging
+import queue
+import threading
+import time
+
+import config
+from lib import session
+from lib import stats
+
+try:
+    from pushover import Pushover
+except ImportError:
+    Pushover = None
+
+logger = logging.getLogger(__name__)
+
+# Pushover rejects messages and titles longer than these
+MESSAGE_LIMIT = 1024
+TITLE_LIMIT = 250
+
+_dispatcher = None
+_lock = threading.Lock()
+
+
+class PushoverBackend(object):
+    """Sends notifications with the pushover package"""
+
+    def __init__(self):
+        if Pushover is None:
+            raise RuntimeError("pushover notifications need the pushover package installed")
+        self.client = Pushover(config.pushover_app_token)
+        self.client.user(config.pushover_user_key)
+
+    def send(self, title, text, html=False):
+        msg = self.client.msg(text)
+        msg.set('title', title)
+        if html:
+            msg.set('html', 1)
+        with stats.span('pushover'):
+            response = self.client.send(msg)
+        logger.debug("pushover answered {}".format(response))
+
+
+class LogBackend(object):
+    """Logs notifications and keeps them in sent, a stand-in for pushover when testing"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, title, text, html=False):
+        self.sent.append((title, text))
+        logger.info("notification: {}\n{}".format(title, text))
+
+
+# notify_backend: factory, register more with register()
+BACKENDS = {'pushover': PushoverBackend, 'log': LogBackend}
+
+
+def register(name, factory):
+    """Make a backend available as notify_backend=name, factory() returns an object with send(title, text, html)"""
+    BACKENDS[name] = factory
+
+
+def split(entries, limit=MESSAGE_LIMIT):
+    """Join entries into as few texts of at most limit characters as possible, cutting entries only if one is too long"""
+    texts = []
+    current = []
+    size = 0
+    for entry in entries:
+        while len(entry) > limit:
+            entry_part, entry = entry[:limit], entry[limit:]
+            if current:
+                texts.append("".join(current))
+                current, size = [], 0
+            texts.append(entry_part)
+        if size + len(entry) > limit:
+            texts.append("".join(current))
+            current, size = [], 0
+        if entry:
+            current.append(entry)
+            size += len(entry)
+    if current:
+        texts.append("".join(current))
+    return texts
+
+
+class Dispatcher(object):
+    """Sends notifications from a background thread so a slow or failing backend never holds up a run
+
+    Entries queued with add() are kept until flush(), so the tv and movie passes of a run go out
+    together, then sent in as few messages as the size limit allows."""
+
+    def __init__(self, backend, retries=3):
+        self.backend = backend
+        self.retries = retries
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.order = []
+        self.thread = threading.Thread(target=self.run, name='notify', daemon=True)
+        self.thread.start()
+
+    def add(self, title, entry):
+        self.queue.put(('add', title, entry))
+
+    def flush(self):
+        self.queue.put(('flush', None, None))
+
+    def close(self, timeout=None):
+        """Send what is queued and stop the thread, waiting at most timeout seconds"""
+        self.queue.put(('stop', None, None))
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.warning("gave up waiting for notifications to be sent")
+
+    def run(self):
+        while True:
+            action, title, entry = self.queue.get()
+            if action == 'add':
+                if title not in self.pending:
+                    self.pending[title] = []
+                    self.order.append(title)
+                self.pending[title].append(entry)
+                continue
+            self.send_pending()
+            if action == 'stop':
+                return
+
+    def send_pending(self):
+        """Send the queued entries, entries under several headings go out together with a bold line per heading"""
+        pending, order = self.pending, self.order
+        self.pending, self.order = {}, []
+        if not order:
+            return
+        if len(order) == 1:
+            title, entries = order[0], pending[order[0]]
+        else:
+            title = "{} New Titles Added".format(sum(len(pending[name]) for name in order))
+            entries = []
+            for name in order:
+                entries.append("<b>{}</b>\n".format(name))
+                entries.extend(pending[name])
+        texts = split(entries)
+        for i, text in enumerate(texts):
+            part = title if len(texts) == 1 else "{} ({}/{})".format(title, i + 1, len(texts))
+            self.send(part[:TITLE_LIMIT], text)
+
+    def send(self, title, text):
+        """Send one message, retrying with exponential backoff, a message that keeps failing is dropped"""
+        for attempt in range(self.retries + 1):
+            try:
+                self.backend.send(title, text, html=True)
+                stats.count('notifications.sent')
+                return True
+            except Exception as e:
+                if attempt >= self.retries:
+                    logger.error("could not send notification {}: {}: {}".format(title, type(e).__name__, e))
+                    stats.count('notifications.failed')
+                    return False
+                delay = session.backoff(attempt + 1)
+                logger.warning("notification {} failed ({}), retrying in {:.1f}s".format(title, e, delay))
+                time.sleep(delay)
+
+
+def enabled():
+    name = getattr(config, 'notify_backend', 'pushover')
+    return name != 'pushover' or config.pushover_enabled
+
+
+def get_dispatcher():
+    """Return the shared dispatcher, started on first use with the notify_backend backend"""
+    global _dispatcher
+    with _lock:
+        if _dispatcher is None:
+            backend = BACKENDS[getattr(config, 'notify_backend', 'pushover')]()
+            _dispatcher = Dispatcher(backend, getattr(config, 'notify_retries', 3))
+        return _dispatcher
+
+
+def add(title, entry):
+    """Queue an entry to be sent under title at the next flush, nothing is sent when notifications are off"""
+    if enabled():
+        get_dispatcher().add(title, entry)
+
+
+def flush():
+    with _lock:
+        if _dispatcher is not None:
+            _dispatcher.flush()
+
+
+def close(timeout=30):
+    """Send everything queued and stop the dispatcher, waiting at most timeout seconds"""
+    global _dispatcher
+    with _lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.close(timeout)
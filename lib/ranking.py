@@ -0,0 +1,104 @@
+import datetime
+import heapq
+import logging
+import math
+import sqlite3
+import time
+
+import config
+from lib import library
+
+logger = logging.getLogger(__name__)
+
+# Weight of each score component, every component is between 0 and 1
+DEFAULT_WEIGHTS = {'rating': 0.4, 'votes': 0.3, 'lists': 0.2, 'recency': 0.1}
+# Votes at which the votes component is full, it grows with the log of the votes below that
+FULL_VOTES = 100000
+# Trakt lists a title can be on: anticipated, popular and trending
+LIST_COUNT = 3
+# Years after which a title gets nothing for recency
+RECENCY_YEARS = 10
+DAY = 24 * 3600
+
+
+def score(title, weights=None, year=None):
+    """Score of a title passing the filters, higher is better"""
+    weights = weights or getattr(config, 'ranking_weights', DEFAULT_WEIGHTS)
+    year = year or datetime.date.today().year
+    rating = min(float(title.get('rating') or 0) / 10, 1)
+    votes = min(math.log10((title.get('votes') or 0) + 1) / math.log10(FULL_VOTES + 1), 1)
+    lists = min(len(title.get('lists') or ()) / float(LIST_COUNT), 1)
+    if title.get('year'):
+        recency = max(0.0, 1 - max(year - title['year'], 0) / float(RECENCY_YEARS))
+    else:
+        recency = 0.0
+    return (weights.get('rating', 0) * rating + weights.get('votes', 0) * votes +
+            weights.get('lists', 0) * lists + weights.get('recency', 0) * recency)
+
+
+def top(titles, k):
+    """The k best scored titles, best first, all of them when k is None"""
+    weights = getattr(config, 'ranking_weights', DEFAULT_WEIGHTS)
+    year = datetime.date.today().year
+    scored = [(score(title, weights, year), -i, title) for i, title in enumerate(titles)]
+    if k is None:
+        best = sorted(scored, reverse=True)
+    else:
+        best = heapq.nlargest(k, scored)
+    return [title for title_score, i, title in best]
+
+
+class AddBudget(object):
+    """How many titles an instance may still add, per run and over the last 24 hours
+
+    Adds are counted in the add_budget table of pingrr.db, a budget of 0 means no limit."""
+
+    def __init__(self, scope, per_run=0, per_day=0, path=None):
+        self.scope = scope
+        self.per_run = per_run
+        self.per_day = per_day
+        self.path = path or library.data_file('pingrr.db')
+
+    def connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE IF NOT EXISTS add_budget (scope TEXT, added REAL, count INTEGER)")
+        return db
+
+    def added_today(self):
+        db = self.connect()
+        try:
+            db.execute("DELETE FROM add_budget WHERE added < ?", (time.time() - DAY,))
+            db.commit()
+            row = db.execute("SELECT SUM(count) FROM add_budget WHERE scope = ?", (self.scope,)).fetchone()
+        finally:
+            db.close()
+        return row[0] or 0
+
+    def remaining(self):
+        """Titles this run may add, None when there is no limit"""
+        limits = []
+        if self.per_run:
+            limits.append(self.per_run)
+        if self.per_day:
+            limits.append(max(self.per_day - self.added_today(), 0))
+        return min(limits) if limits else None
+
+    def record(self, count):
+        if not count or not self.per_day:
+            return
+        db = self.connect()
+        try:
+            db.execute("INSERT INTO add_budget VALUES (?, ?, ?)", (self.scope, time.time(), count))
+            db.commit()
+        finally:
+            db.close()
+
+
+def select(titles, budget):
+    """The titles to add this run, best scored first and no more than the budget allows"""
+    k = budget.remaining()
+    chosen = top(titles, k)
+    if len(chosen) < len(titles):
+        logger.info("{} add budget allows {} of {} titles, keeping the best scored".format(
+            budget.scope, len(chosen), len(titles)))
+    return chosen
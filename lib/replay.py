@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from lib import session
+
+logger = logging.getLogger(__name__)
+
+# Response headers pingrr reads, kept in fixtures
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'X-Pagination-Page-Count', 'X-Pagination-Item-Count')
+
+_recorder = None
+
+
+def path_of(url):
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class Recorder(object):
+    """Keeps the HTTP exchanges made through lib.session, saved as a fixture file for ReplayServer"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.exchanges = []
+
+    def __call__(self, method, url, response):
+        exchange = {'host': urlsplit(url).netloc,
+                    'method': method,
+                    'path': path_of(url),
+                    'status': response.status_code,
+                    'headers': dict((name, response.headers[name]) for name in KEPT_HEADERS if name in response.headers),
+                    'body': response.content.decode('utf-8', 'replace')}
+        with self.lock:
+            self.exchanges.append(exchange)
+
+    def save(self):
+        with self.lock:
+            exchanges = list(self.exchanges)
+        with open(self.path, 'w') as f:
+            json.dump({'exchanges': exchanges}, f)
+        logger.info("recorded {} HTTP exchanges to {}".format(len(exchanges), self.path))
+
+
+def start_recording(path):
+    """Record every exchange made through lib.session until stop_recording()"""
+    global _recorder
+    _recorder = Recorder(path)
+    session.response_hooks.append(_recorder)
+    return _recorder
+
+
+def recording():
+    """True while exchanges are recorded, caches that would hide them from the recorder are bypassed"""
+    return _recorder is not None
+
+
+def stop_recording():
+    global _recorder
+    if _recorder is not None:
+        session.response_hooks.remove(_recorder)
+        _recorder.save()
+        _recorder = None
+
+
+def load(path):
+    """Fixture exchanges grouped by host"""
+    with open(path) as f:
+        exchanges = json.load(f)['exchanges']
+    hosts = {}
+    for exchange in exchanges:
+        hosts.setdefault(exchange['host'], []).append(exchange)
+    return hosts
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answers with the recorded response of the same method and path
+
+    Unrecorded POST/PUT requests are echoed back with an id, like a sonarr/radarr add, anything
+    else unrecorded gets a 404."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        exchange = server.exchanges.get((self.command, self.path))
+        if exchange is not None:
+            return self.send(exchange['status'], exchange['body'].encode('utf-8'), exchange['headers'])
+        if self.command in ('POST', 'PUT'):
+            try:
+                echo = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                echo = {}
+            if isinstance(echo, dict):
+                with server.lock:
+                    server.next_id += 1
+                    echo.setdefault('id', server.next_id)
+            return self.send(201, json.dumps(echo).encode('utf-8'), {'Content-Type': 'application/json'})
+        self.send(404, b'{"message": "not recorded"}', {'Content-Type': 'application/json'})
+
+    do_GET = do_POST = do_PUT = do_DELETE = reply
+
+    def send(self, status, data, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(object):
+    """Serves the recorded exchanges of one host on a local port, waiting latency seconds per request"""
+
+    def __init__(self, exchanges, latency=0, port=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), ReplayHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.latency = latency
+        self.server.requests = 0
+        self.server.next_id = 100000
+        # the last recorded answer wins, so a replay ends in the state the recording ended in
+        self.server.exchanges = dict(((exchange['method'], exchange['path']), exchange) for exchange in exchanges)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, name='replay', daemon=True)
+        self.thread.start()
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def serve(hosts, latency=0):
+    """Start a ReplayServer per recorded host, returns {host: server}"""
+    return dict((host, ReplayServer(exchanges, latency)) for host, exchanges in hosts.items())
@@ -0,0 +1,49 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+
+    def __init__(self, name, func, interval, jitter=0):
+        """Run func every interval seconds, delayed by up to jitter seconds each time"""
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = time.time()
+
+    def schedule(self):
+        self.next_run = time.time() + self.interval + random.uniform(0, self.jitter)
+        logger.info("next {} check at {}".format(self.name, time.strftime('%H:%M:%S', time.localtime(self.next_run))))
+
+
+class Scheduler(object):
+    """Runs jobs on their own intervals from one thread until stop() is called"""
+
+    def __init__(self):
+        self.jobs = []
+        self.stopping = threading.Event()
+
+    def add(self, name, func, interval, jitter=0):
+        self.jobs.append(Job(name, func, interval, jitter))
+
+    def run(self):
+        while self.jobs and not self.stopping.is_set():
+            job = min(self.jobs, key=lambda j: j.next_run)
+            if self.stopping.wait(max(job.next_run - time.time(), 0)):
+                break
+            try:
+                job.func()
+            except Exception as e:
+                logger.exception("{} check failed: {}".format(job.name, e))
+            job.schedule()
+        logger.info("scheduler stopped")
+
+    def stop(self, *args):
+        """Stop after the running job, usable as a signal handler"""
+        logger.info("stopping scheduler")
+        self.stopping.set()
@@ -0,0 +1,210 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from lib import stats
+
+logger = logging.getLogger(__name__)
+
+RETRY_METHODS = frozenset(['GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'])
+RETRY_STATUS = (500, 502, 503, 504)
+
+# Requests per second and burst size by host, trakt allows 1000 GET calls every 5 minutes
+DEFAULT_RATE_LIMITS = {'api.trakt.tv': (1000 / 300.0, 20)}
+DEFAULT_RATE_LIMIT = (10, 10)
+
+_session = None
+_lock = threading.Lock()
+request_counts = {}
+# (requests, connections) by host at the last log_stats, so each run reports its own use
+_logged = {}
+limiters = {}
+# hook(method, url, response) is called with every response, lib.replay records exchanges this way
+response_hooks = []
+
+
+class TokenBucket(object):
+    """Paces requests to one host: rate per second with bursts, a pause after 429 and a concurrency cap"""
+
+    def __init__(self, rate, burst, concurrency):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+    def reserve(self):
+        """Take a token, returns how many seconds to wait before the request may be sent"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(delay, self.paused_until - now)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold every request to the host for seconds, after it asked us to slow down"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def get_limiter(host):
+    with _lock:
+        if host not in limiters:
+            rate, burst = getattr(config, 'rate_limits', {}).get(host) or DEFAULT_RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            limiters[host] = TokenBucket(rate, burst, getattr(config, 'http_max_concurrency', 4))
+        return limiters[host]
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header, in seconds or as an HTTP date, or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, getattr(config, 'http_backoff', 0.5) * (2 ** attempt))
+
+
+def build_retry():
+    """Retry idempotent requests on connection errors and 5xx answers, with exponential backoff"""
+    kwargs = {'total': getattr(config, 'http_retries', 3),
+              # a read timeout is raised as ReadTimeout at once, a slow library is not asked for again
+              'read': False,
+              'backoff_factor': getattr(config, 'http_backoff', 0.5),
+              'status_forcelist': RETRY_STATUS,
+              'raise_on_status': False}
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **kwargs)
+
+
+def get_session():
+    """Return the shared session, keeping a pool of keep-alive connections per host"""
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = getattr(config, 'http_pool_size', 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=build_retry())
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+def request(method, url, **kwargs):
+    """Send a request through the shared session, paced by the host's token bucket
+
+    Answers of 429 Too Many Requests pause the host for its Retry-After, or an exponential
+    backoff with jitter, and are retried up to http_retries times."""
+    host = urlsplit(url).netloc
+    limiter = get_limiter(host)
+    retries = getattr(config, 'http_retries', 3)
+    kwargs.setdefault('timeout', getattr(config, 'http_timeout', 60))
+
+    attempt = 0
+    while True:
+        with _lock:
+            request_counts[host] = request_counts.get(host, 0) + 1
+        limiter.acquire()
+        start = time.monotonic()
+        with limiter.slots:
+            r = get_session().request(method, url, **kwargs)
+        retrying = r.status_code == 429 and attempt < retries
+        stats.record_http(url, r.status_code, response_size(r, kwargs.get('stream')), time.monotonic() - start,
+                          retried(r) + (1 if retrying else 0))
+        for hook in response_hooks:
+            hook(method, url, r)
+        if not retrying:
+            return r
+
+        delay = retry_after(r)
+        if delay is None:
+            delay = backoff(attempt)
+        logger.warning("{} asked to slow down, retrying {} in {:.1f}s".format(host, urlsplit(url).path, delay))
+        limiter.pause(delay)
+        r.close()
+        attempt += 1
+
+
+def response_size(response, stream=False):
+    """Bytes of a response body, streamed bodies are counted by their reader through stats.add_bytes"""
+    if stream:
+        return 0
+    return len(response.content or b'')
+
+
+def retried(response):
+    """Number of retries urllib3 made for connection errors and 5xx answers before this response"""
+    retries = getattr(response.raw, 'retries', None)
+    return len(getattr(retries, 'history', None) or ())
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+def connection_stats():
+    """Return {host: (requests, connections opened)} for the hosts still pooled"""
+    by_host = {}
+    if _session is None:
+        return by_host
+    pools = _session.get_adapter('https://').poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = pool.host if pool.port in (None, 80, 443) else '%s:%s' % (pool.host, pool.port)
+        by_host[host] = (request_counts.get(host, pool.num_requests), pool.num_connections)
+    return by_host
+
+
+def log_stats():
+    """Log how well connections were reused for each host since the last call"""
+    for host, (count, connections) in sorted(connection_stats().items()):
+        logged_count, logged_connections = _logged.get(host, (0, 0))
+        _logged[host] = (count, connections)
+        count, connections = count - logged_count, connections - logged_connections
+        if count:
+            logger.info("{}: {} requests over {} connections ({} reused)".format(
+                host, count, connections, max(count - connections, 0)))
@@ -1,42 +1,200 @@
-import requests, config, logging
+import requests, config, codecs, json, logging, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.exceptions import ReadTimeoutError
 
-logger = logging.getLogger(__name__)
+from lib import library
+from lib import metadata
+from lib import replay
+from lib import session
+from lib import stats
 
-requests.adapters.DEFAULT_RETRIES = 5
+logger = logging.getLogger(__name__)
 
-def get_sonarr_library():
-	"""Get sonarr library in a list of tvdbid ids"""
-	library = []
-	headers = {'X-Api-Key': config.sonarr_api}
-	r = requests.get(config.sonarr_host + '/api/v3/series', headers=headers, timeout=60)
-	try:
-		if r.status_code == 401:
-			logger.warning("Error when connecting to sonarr, unauthorised. check api/url")
-			sys.exit(1)
-		tv_lib_raw = r.json()
-		for n in tv_lib_raw:
-			library.append(n['tvdbId'])
-	except requests.ConnectionError:
-		logger.warning("Can not connect to sonarr check if sonarr is up, or URL is right")
-		sys.exit(1)
-	return library
-
-def get_radarr_library():
-	"""Get radarr library in a list of imdb ids"""
-	library = []
-	headers = {'X-Api-Key': config.radarr_api}
-	r = requests.get(config.radarr_host + '/api/v3/movie', headers=headers, timeout=60)
+CHUNK_SIZE = 64 * 1024
+ENDPOINTS = {'sonarr': 'series', 'radarr': 'movie'}
+
+class Unauthorized(requests.exceptions.RequestException):
+	"""Sonarr/radarr rejected the api key"""
+
+class JsonArrayParser(object):
+	"""Incremental parser of a JSON array, fed byte chunks and returning the elements completed
+
+	Only the element being decoded is held in memory, so a library of any size is parsed in
+	roughly constant memory."""
+
+	def __init__(self):
+		self.decoder = json.JSONDecoder()
+		self.utf8 = codecs.getincrementaldecoder('utf-8')()
+		self.buf = ''
+		self.started = False
+		self.done = False
+
+	def feed(self, chunk):
+		items = []
+		buf = self.buf + self.utf8.decode(chunk)
+		pos = 0
+		while not self.done:
+			while pos < len(buf) and buf[pos] in ' \t\r\n,':
+				pos += 1
+			if pos >= len(buf):
+				break
+			if not self.started:
+				if buf[pos] != '[':
+					raise ValueError("expected a JSON array, got {!r}".format(buf[pos:pos + 20]))
+				self.started = True
+				pos += 1
+				continue
+			if buf[pos] == ']':
+				self.done = True
+				break
+			try:
+				item, end = self.decoder.raw_decode(buf, pos)
+			except ValueError:
+				# element is not complete yet, wait for the next chunk
+				break
+			if not isinstance(item, (dict, list)):
+				# a bare number may continue in the next chunk ('-0.' + '5'), only take a scalar
+				# once the , or ] after it has arrived
+				after = end
+				while after < len(buf) and buf[after] in ' \t\r\n':
+					after += 1
+				if after >= len(buf) or buf[after] not in ',]':
+					break
+			items.append(item)
+			pos = end
+		self.buf = buf[pos:]
+		return items
+
+	def close(self):
+		if not self.done:
+			raise ValueError("truncated JSON array")
+
+def counted(chunks, url):
+	"""Pass chunks of a streamed response through, counting their bytes for the run stats"""
+	for chunk in chunks:
+		stats.add_bytes(url, len(chunk))
+		yield chunk
+
+def iter_json_array(chunks):
+	"""Yield the elements of a JSON array one at a time from an iterable of byte chunks"""
+	parser = JsonArrayParser()
+	for chunk in chunks:
+		for item in parser.feed(chunk):
+			yield item
+		if parser.done:
+			return
+	parser.close()
+
+def get_library(program, host, api_key, endpoint, index=None, name=None):
+	"""Get a sonarr/radarr library as a LibraryIndex and save it for the next run
+
+	If a saved index is given its ETag/Last-Modified are sent along, and it is kept as is when
+	sonarr/radarr answers that nothing changed. Raises Unauthorized on a 401, connection errors and
+	timeouts are left to the caller."""
+	headers = {'X-Api-Key': api_key}
+	if index is not None:
+		if index.etag:
+			headers['If-None-Match'] = index.etag
+		if index.last_modified:
+			headers['If-Modified-Since'] = index.last_modified
+	url = host + '/api/v3/' + endpoint
+	r = session.get(url, headers=headers, timeout=60, stream=True)
 	try:
 		if r.status_code == 401:
-			logger.warning("Error when connecting to radarr, unauthorised. check api/url")
-			sys.exit(1)
-		movie_lib_raw = r.json()
-		for n in movie_lib_raw:
-			library.append(n['tmdbId'])
-	except requests.ConnectionError:
-		logger.warning("Can not connect to radarr check if radarr is up, or URL is right")
-		sys.exit(1)
-	return library
+			raise Unauthorized("{} answered 401 unauthorised, check api/url".format(name or program), response=r)
+		if r.status_code == 304 and index is not None:
+			logger.debug("{} library not modified since last sync".format(program))
+			index.refreshed()
+		else:
+			try:
+				index = library.LibraryIndex(program, name).extend(iter_json_array(counted(r.iter_content(CHUNK_SIZE), url)))
+			except requests.ConnectionError as e:
+				# requests reports a read timeout in the middle of the body as a ConnectionError
+				if e.args and isinstance(e.args[0], ReadTimeoutError):
+					raise requests.exceptions.ReadTimeout(e, request=r.request)
+				raise
+			index.etag = r.headers.get('ETag')
+			index.last_modified = r.headers.get('Last-Modified')
+	finally:
+		r.close()
+	index.persist()
+	return index
+
+def sync_library(program, host, api_key, endpoint, index=None, name=None, fetch=None):
+	"""Get a sonarr/radarr library, reusing the saved index until a full refresh is due
+
+	index is the index already held in memory, if not given the one saved for the instance name is
+	loaded. Between full
+	refreshes the index is marked stale, titles missing from it are confirmed with in_library
+	before they are added. fetch downloads the library, get_library by default.
+
+	While HTTP is recorded the whole library is always downloaded, so the fixture holds it."""
+	if replay.recording():
+		index = None
+	elif index is None:
+		index = library.LibraryIndex.load(program, name=name)
+	interval = getattr(config, 'library_full_refresh', 24) * 3600
+	if index is not None and interval > 0 and time.time() - (index.updated or 0) < interval:
+		logger.info("Using saved {} library index of {} items, full refresh in {} minutes".format(
+			index.name, len(index), int((interval - (time.time() - index.updated)) / 60)))
+		index.stale = True
+		return index
+	return (fetch or get_library)(program, host, api_key, endpoint, index, name)
+
+def in_library(index, host, api_key, media_id):
+	"""Check with sonarr/radarr if a title missing from a stale index has been added since"""
+	if index.program == 'radarr':
+		endpoint, key = 'movie', 'tmdbId'
+	else:
+		endpoint, key = 'series', 'tvdbId'
+	headers = {'X-Api-Key': api_key}
+	r = session.get('{}/api/v3/{}?{}={}'.format(host, endpoint, key, media_id), headers=headers, timeout=30)
+	if r.status_code != requests.codes.ok:
+		return False
+	for item in r.json():
+		if item.get(key) == media_id:
+			index.add(library.from_arr(item))
+			return True
+	return False
+
+def get_sonarr_library(index=None):
+	"""Get sonarr library indexed by tvdb id"""
+	return sync_library('sonarr', config.sonarr_host, config.sonarr_api, 'series', index)
+
+def get_radarr_library(index=None):
+	"""Get radarr library indexed by tmdb id"""
+	return sync_library('radarr', config.radarr_host, config.radarr_api, 'movie', index)
+
+def error_message(response):
+	"""Readable text of a failed sonarr/radarr add response"""
+	if isinstance(response, list):
+		return "; ".join(str(error.get('errorMessage', error)) if isinstance(error, dict) else str(error) for error in response)
+	if isinstance(response, dict):
+		return str(response.get('message') or response.get('errorMessage') or response)
+	return str(response)
+
+def add_result(response, exception=None):
+	"""Result of one add: {'ok', 'id', 'error', 'response'}"""
+	if exception is not None:
+		return {'ok': False, 'id': None, 'error': '{}: {}'.format(type(exception).__name__, exception), 'response': None}
+	if isinstance(response, dict) and response.get('id'):
+		return {'ok': True, 'id': response['id'], 'error': None, 'response': response}
+	return {'ok': False, 'id': None, 'error': error_message(response), 'response': response}
+
+def bulk_add(api, program, payloads, workers=4):
+	"""Add series/movies through a pool of at most workers concurrent requests
+
+	Returns a result per payload, in order, see add_result."""
+	add = api.add_movie if program == 'radarr' else api.add_series
+
+	def submit(payload):
+		try:
+			return add_result(add(payload))
+		except Exception as e:
+			return add_result(None, e)
+
+	with ThreadPoolExecutor(max_workers=max(1, min(workers, len(payloads)))) as pool:
+		return list(pool.map(submit, payloads))
 
 class API(object):
 
@@ -44,6 +202,7 @@ class API(object):
 		"""Constructor requires Host-URL and API-KEY"""
 		self.host_url = host_url
 		self.api_key = api_key
+		self.metadata = metadata.Resolver(self)
 
 	# ENDPOINT CALENDAR
 	def get_calendar(self):
@@ -53,7 +212,7 @@ class API(object):
 		return res.json()
 
 	def get_profile_id(self, name):
-		profiles = self.get_quality_profiles()
+		profiles = self.metadata.quality_profiles()
 		for profile in profiles:
 			if profile['name'] == name: return profile['id']
 			
@@ -128,7 +287,13 @@ class API(object):
 	# ENDPOINT PROFILE
 	def get_quality_profiles(self):
 		"""Gets all quality profiles"""
-		res = self.request_get("{}/profile".format(self.host_url))
+		res = self.request_get("{}/qualityprofile".format(self.host_url))
+		return res.json()
+
+	# ENDPOINT TAG
+	def get_tags(self):
+		"""Gets all tags"""
+		res = self.request_get("{}/tag".format(self.host_url))
 		return res.json()
 
 	# ENDPOINT RELEASE
@@ -169,7 +334,7 @@ class API(object):
 		s_dict = res.json()[0]
 
 		# get root folder path
-		root = self.get_root_folder()[0]['path']
+		root = self.metadata.root_folders()[0]['path']
 		series_json = {
 			'title': s_dict['title'],
 			'seasons': s_dict['seasons'],
@@ -234,34 +399,40 @@ class API(object):
 		return res.json()
 
 	# REQUESTS STUFF
+	def authorised(self, res):
+		"""Raise Unauthorized when the api key was rejected, so only this instance is skipped"""
+		if res.status_code == 401:
+			raise Unauthorized("{} answered 401 unauthorised, check api/url".format(self.host_url), response=res)
+		return res
+
 	def request_get(self, url, data={}):
-		"""Wrapper on the requests.get"""
+		"""Wrapper on the pooled session get"""
 		headers = {
 			'X-Api-Key': self.api_key
 		}
-		res = requests.get(url, headers=headers, json=data)
-		return res
+		res = session.get(url, headers=headers, json=data)
+		return self.authorised(res)
 
 	def request_post(self, url, data):
-		"""Wrapper on the requests.post"""
+		"""Wrapper on the pooled session post"""
 		headers = {
 			'X-Api-Key': self.api_key
 		}
-		res = requests.post(url, headers=headers, json=data)
-		return res
+		res = session.post(url, headers=headers, json=data)
+		return self.authorised(res)
 
 	def request_put(self, url, data):
-		"""Wrapper on the requests.put"""
+		"""Wrapper on the pooled session put"""
 		headers = {
 			'X-Api-Key': self.api_key
 		}
-		res = requests.put(url, headers=headers, json=data)
-		return res
+		res = session.put(url, headers=headers, json=data)
+		return self.authorised(res)
 
 	def request_del(self, url, data={}):
-		"""Wrapper on the requests.delete"""
+		"""Wrapper on the pooled session delete"""
 		headers = {
 			'X-Api-Key': self.api_key
 		}
-		res = requests.delete(url, headers=headers, json=data)
-		return res
+		res = session.delete(url, headers=headers, json=data)
+		return self.authorised(res)
@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import config
+from lib import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RunStats(object):
+    """Timings and counters of one run: phase spans, HTTP calls per host and named counters
+
+    Spans with the same name are aggregated into a count, total and slowest time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.spans = {}
+        self.hosts = {}
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.monotonic() - start)
+
+    def add_span(self, name, elapsed):
+        with self.lock:
+            count, total, slowest = self.spans.get(name, (0, 0.0, 0.0))
+            self.spans[name] = (count + 1, total + elapsed, max(slowest, elapsed))
+
+    def host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'requests': 0, 'bytes': 0, 'retries': 0, 'latency': 0.0, 'slowest': 0.0,
+                                'status': {}}
+        return self.hosts[host]
+
+    def record_http(self, url, status, size, elapsed, retries=0):
+        """Record one HTTP call, elapsed in seconds and retries made by the session for it"""
+        host = urlsplit(url).netloc
+        metrics.record_http(host, status, size, elapsed, retries)
+        with self.lock:
+            entry = self.host(host)
+            entry['requests'] += 1
+            entry['bytes'] += size
+            entry['retries'] += retries
+            entry['latency'] += elapsed
+            entry['slowest'] = max(entry['slowest'], elapsed)
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+
+    def add_bytes(self, url, size):
+        """Count bytes of a streamed response, read after the call was recorded"""
+        host = urlsplit(url).netloc
+        metrics.add_bytes(host, size)
+        with self.lock:
+            self.host(host)['bytes'] += size
+
+    def count(self, name, value=1):
+        metrics.record_count(name, value)
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        with self.lock:
+            return {'started': self.started,
+                    'duration': time.time() - self.started,
+                    'spans': dict((name, {'count': count, 'total': total, 'slowest': slowest})
+                                  for name, (count, total, slowest) in self.spans.items()),
+                    'http': json.loads(json.dumps(self.hosts)),
+                    'counters': dict(self.counters)}
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info("run took {:.1f}s".format(summary['duration']))
+        for name, span in sorted(summary['spans'].items(), key=lambda item: -item[1]['total']):
+            logger.info("{}: {:.2f}s over {} calls, slowest {:.2f}s".format(
+                name, span['total'], span['count'], span['slowest']))
+        for host, entry in sorted(summary['http'].items()):
+            logger.info("{}: {} requests, {} KB, {:.2f}s average, {} retries, status {}".format(
+                host, entry['requests'], entry['bytes'] // 1024, entry['latency'] / max(entry['requests'], 1),
+                entry['retries'], entry['status']))
+        for name, value in sorted(summary['counters'].items()):
+            logger.info("{}: {}".format(name, value))
+        return summary
+
+
+_stats = RunStats()
+
+
+def current():
+    return _stats
+
+
+def reset():
+    """Start collecting a new run"""
+    global _stats
+    _stats = RunStats()
+
+
+def span(name):
+    return _stats.span(name)
+
+
+def count(name, value=1):
+    _stats.count(name, value)
+
+
+def record_http(url, status, size, elapsed, retries=0):
+    _stats.record_http(url, status, size, elapsed, retries)
+
+
+def add_bytes(url, size):
+    _stats.add_bytes(url, size)
+
+
+def report():
+    """Log the summary of the run, append it to stats_file when set, and start a new run"""
+    summary = _stats.log_summary()
+    metrics.record_run(summary['duration'], time.time())
+    path = getattr(config, 'stats_file', '')
+    if path:
+        try:
+            with open(path, 'a') as f:
+                f.write(json.dumps(summary, sort_keys=True) + '\n')
+        except (IOError, OSError) as e:
+            logger.warning("Can not write run stats to {}: {}".format(path, e))
+    reset()
+    return summary
@@ -1,8 +1,14 @@
 import logging
 import config
 import requests
-import urllib
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote_plus
+
+from lib import cache
+from lib import logs
+from lib import media
+from lib import stats
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +22,16 @@ headers = {
 popular = []
 anticipated = []
 trending = []
+executor = None
+
+
+def base_url():
+    """trakt API root, trakt_url points it at a replay server for benchmarks"""
+    return getattr(config, 'trakt_url', 'https://api.trakt.tv').rstrip('/')
+
+
+def list_url(name, cat, page=1):
+    return "{}/{}/{}/?page={}&limit={}&extended=full".format(base_url(), name, cat, page, str(config.trakt_limit))
 
 
 def search(search_string, trakt_type):
@@ -24,9 +40,9 @@ def search(search_string, trakt_type):
     if search_string is None:
         return False
 
-    url = "https://api.trakt.tv/search/{}?query={}&extended=full".format(trakt_type, urllib.quote_plus(search_string))
+    url = "{}/search/{}?query={}&extended=full".format(base_url(), trakt_type, quote_plus(search_string))
     logger.debug('getting info from trakt for {}'.format(search_string))
-    r = requests.get(url=url, headers=headers, timeout=10)
+    r = cache.get_cache().get(url, 'search', cache.ttl('search'), headers=headers, timeout=10)
 
     # If request was as ok, and json data returned continue
     if r.status_code == requests.codes.ok and r.json():
@@ -76,61 +92,32 @@ def search(search_string, trakt_type):
             except KeyError:
                 logger.info("{0}:{2} using trakt votes ({1}), not imdb".format(y[0][trakt_type]['title'], votes, search_string))
 
-        # if movie details where requested return movie payload
-        if trakt_type == "movie":
-            x.append({'title': y['title'],
-                      'tmdb': y['ids']['tmdb'],
-                      'imdb': y['ids']['imdb'],
-                      'trakt': y['ids']['trakt'],
-                      'rating': user_rating,
-                      'language': y['language'],
-                      'genres': genre,
-                      'votes': votes,
-                      'runtime': y['runtime'],
-                      'certification': y['certification'],
-                      'released': y['released'],
-                      'year': y['year']})
-            logger.debug("got {}'s info successfully".format(y['title']))
-            return x
-
-        # if TV details where requested return TV payload
-        elif trakt_type == "show":
-            x.append({'title': y['title'],
-                      'status': y['status'],
-                      'tvdb': y['ids']['tvdb'],
-                      'imdb': y['ids']['imdb'],
-                      'trakt': y['ids']['trakt'],
-                      'rating': user_rating,
-                      'language': y['language'],
-                      'country': y['country'],
-                      'genres': genre,
-                      'network': y['network'],
-                      'votes': votes,
-                      'runtime': y['runtime'],
-                      'year': y['year'],
-                      'aired': y['aired_episodes']})
-            logger.debug("got {}'s info successfully".format(y['title']))
-            return x
+        x.append(media.from_trakt(trakt_type, y, user_rating, genre, votes))
+        logger.debug("got {}'s info successfully".format(y['title']))
+        return x
 
     else:
         logger.debug('failed to get trakt show info for {}, code return: {}'.format(search_string, str(r.status_code)))
         return False
 
-def get_trakt_data(name, cat):
-    """Get trakt list info"""
+def get_trakt_data(name, cat, page=1):
+    """Get one page of a trakt list, returns (titles, number of pages in the list)"""
 
 #    if cat == 'trending':
 #        url = "https://api.trakt.tv/{}/{}/?limit=100&extended=full".format(name, cat)
 #    else:
-    url = "https://api.trakt.tv/{}/{}/?limit={}&extended=full".format(name, cat, str(config.trakt_limit))
+    url = list_url(name, cat, page)
 
-    r = requests.get(url=url, headers=headers)
+    with stats.span('trakt.{}.{}'.format(name, cat)):
+        r = cache.get_cache().get(url, cat, cache.ttl(cat), headers=headers)
 
     if r.status_code == requests.codes.ok:
-        logger.debug('got trakt {} {} list successfully'.format(name, cat))
+        logger.debug('got trakt {} {} list page {} successfully'.format(name, cat, page))
     else:
-        logger.debug('failed to get trakt {} {} list, code return: {}'.format(name, cat, str(r.status_code)))
-        return False
+        logger.warning('failed to get trakt {} {} list page {}, code return: {}'.format(name, cat, page, str(r.status_code)))
+        return False, 0
+
+    page_count = int(r.headers.get('X-Pagination-Page-Count', 1))
 
     response = r.json()
 
@@ -156,7 +143,7 @@ def get_trakt_data(name, cat):
             try:
                 m = i.get_movie(obj['ids']['imdb'][2:])
             except TypeError:
-                return False
+                return False, page_count
 
             # Get imdb user rating for show/movie
             try:
@@ -176,73 +163,86 @@ def get_trakt_data(name, cat):
             except KeyError:
                 votes = obj['votes']
 
-        if name == 'movies':
-            x.append({'title': obj['title'],
-                      'tmdb': obj['ids']['tmdb'],
-                      'imdb': obj['ids']['imdb'],
-                      'trakt': obj['ids']['trakt'],
-                      'rating': user_rating,
-                      'language': obj['language'],
-                      'genres': genre,
-                      'votes': votes,
-                      'runtime': obj['runtime'],
-                      'certification': obj['certification'],
-                      'released': obj['released'],
-                      'year': obj['year']})
-            logger.debug("got {}'s info successfully".format(obj['title']))
-        else:
-            x.append({'title': obj['title'],
-                      'status': obj['status'],
-                      'tvdb': obj['ids']['tvdb'],
-                      'imdb': obj['ids']['imdb'],
-                      'trakt': obj['ids']['trakt'],
-                      'rating': user_rating,
-                      'language': obj['language'],
-                      'country': obj['country'],
-                      'genres': genre,
-                      'network': obj['network'],
-                      'votes': votes,
-                      'runtime': obj['runtime'],
-                      'year': obj['year'],
-                      'aired': obj['aired_episodes']})
-            logger.debug("got {}'s info successfully".format(obj['title']))
-    return x
-
-
-def get_info(arg):
-    trakt_temp_tv = []
-    trakt_temp_movie = []
-    if arg == 'tv':
-        logger.info("Checking if any trakt tv lists are required")
-        for tv_list in config.trakt_tv_list:
-            if config.trakt_tv_list[tv_list]:
-                logger.info("Getting {} tv list from trakt".format(tv_list))
-                tv_list_temp = get_trakt_data('shows', tv_list)
-                if tv_list_temp:
-                    trakt_temp_tv.append(tv_list_temp)
-                   
-        trakt_complete_tv = []
-
-        for trakt_list in trakt_temp_tv:
-            for line in trakt_list:
-                if line not in trakt_complete_tv:
-                    trakt_complete_tv.append(line)
-
-        return trakt_complete_tv
-
-    if arg == 'movie':
-        logger.info("Checking if any trakt movie lists are required")
-        for movie_list in config.trakt_movie_list:
-            if config.trakt_movie_list[movie_list]:
-                logger.info("Getting {} movie list from trakt".format(movie_list))
-                movie_list_temp = get_trakt_data('movies', movie_list)
-                if movie_list_temp: trakt_temp_movie.append(movie_list_temp)
-
-        trakt_complete_movie = []
-
-        for trakt_list in trakt_temp_movie:
-            for line in trakt_list:
-                if line not in trakt_complete_movie:
-                    trakt_complete_movie.append(line)
-
-        return trakt_complete_movie
+        x.append(media.from_trakt('movie' if name == 'movies' else 'show', obj, user_rating, genre, votes))
+        logger.debug(logs.Lazy("got {}'s info successfully", obj['title']))
+    return x, page_count
+
+
+def get_executor():
+    """Thread pool shared by all trakt list requests, its size caps concurrent calls to trakt"""
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=getattr(config, 'trakt_concurrency', 4))
+    return executor
+
+
+def list_settings(arg):
+    """Return the trakt path name and the wanted lists config for tv or movies"""
+    return ('shows', config.trakt_tv_list) if arg == 'tv' else ('movies', config.trakt_movie_list)
+
+
+def prefetch(arg):
+    """Start downloading the first page of every wanted trakt list for tv or movies, returns [(list, future)]"""
+    name, lists = list_settings(arg)
+    logger.info("Checking if any trakt {} lists are required".format(arg))
+    pending = []
+    for trakt_list in lists:
+        if lists[trakt_list]:
+            logger.info("Getting {} {} list from trakt".format(trakt_list, arg))
+            pending.append((trakt_list, get_executor().submit(get_trakt_data, name, trakt_list)))
+    return pending
+
+
+def iter_pages(arg, pending=None):
+    """Yield (list, titles) for each page of the wanted trakt lists as soon as it is downloaded
+
+    Once the first page of a list tells how many pages it has, up to trakt_pages pages are
+    requested in parallel."""
+    if pending is None:
+        pending = prefetch(arg)
+    name, lists = list_settings(arg)
+    max_pages = getattr(config, 'trakt_pages', 1)
+
+    futures = dict((future, (trakt_list, 1)) for trakt_list, future in pending)
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            trakt_list, page = futures.pop(future)
+            titles, page_count = future.result()
+            stats.count('trakt_candidates.{}.{}'.format(name, trakt_list), len(titles or ()))
+            if page == 1:
+                for next_page in range(2, min(page_count, max_pages) + 1):
+                    futures[get_executor().submit(get_trakt_data, name, trakt_list, next_page)] = (trakt_list, next_page)
+            if titles:
+                yield trakt_list, titles
+
+
+def get_info(arg, pending=None):
+    """Yield the merged titles of the wanted trakt lists for tv or movies as pages arrive
+
+    Titles are de-duplicated on their trakt and tvdb/tmdb ids, the 'lists' key of each title
+    records every trakt list it was found on. pending can be the result of an earlier prefetch
+    call, so lists are already downloading while the caller does other work."""
+    item_id = 'tvdb' if arg == 'tv' else 'tmdb'
+    seen = {}
+
+    for trakt_list, titles in iter_pages(arg, pending):
+        for line in titles:
+            keys = [('trakt', line['trakt'])]
+            if line[item_id]:
+                keys.append((item_id, line[item_id]))
+
+            merged = None
+            for key in keys:
+                merged = seen.get(key)
+                if merged is not None:
+                    break
+            if merged is not None:
+                if trakt_list not in merged['lists']:
+                    merged['lists'].append(trakt_list)
+                continue
+
+            line['lists'] = [trakt_list]
+            for key in keys:
+                seen[key] = line
+            yield line
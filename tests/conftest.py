@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import config
+except ImportError:
+    # config.py is made from config.py.sample by each user, the tests run with a stand-in
+    config = types.ModuleType('config')
+    config.log_level = 'INFO'
+    config.log_folder = tempfile.mkdtemp(prefix='pingrr-tests-')
+    config.data_folder = config.log_folder
+    config.pingrr_dry_run = True
+    config.pushover_enabled = False
+    config.imdb_info = False
+    config.trakt_api = ''
+    config.message_attributes = ['title', 'year']
+    sys.modules['config'] = config
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from lib import asodarr
+from lib import library
+from lib import replay
+from lib import session
+from lib import sodarr
+from lib import stats
+
+pytest.importorskip('aiohttp')
+
+SERIES = [{'id': i, 'tvdbId': 100 + i, 'imdbId': 'tt%d' % i, 'title': 'Show %d' % i, 'path': '/tv/%d' % i}
+          for i in range(1, 2001)]
+
+
+@pytest.fixture(autouse=True)
+def quick(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'http_backoff', 0.01, raising=False)
+    monkeypatch.setattr(library, 'data_file', lambda name: str(tmp_path / name))
+
+
+@pytest.fixture
+def arr():
+    server = replay.ReplayServer([{'method': 'GET', 'path': '/api/v3/series', 'status': 200,
+                                   'headers': {'Content-Type': 'application/json', 'ETag': '"v1"'},
+                                   'body': json.dumps(SERIES)}])
+    yield server
+    server.stop()
+
+
+class Throttled(BaseHTTPRequestHandler):
+    """Answers 429 to the first server.limit requests, then echoes the request path"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            throttled = self.server.requests <= self.server.limit
+        if throttled:
+            self.send(429, {'message': 'slow down'}, {'Retry-After': '0'})
+        else:
+            self.send(200, self.server.body if self.server.body is not None else {'path': self.path})
+
+    def send(self, status, body, headers={}):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def throttled(limit, body=None):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Throttled)
+    server.body = body
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.limit = limit
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(server, path):
+    async def run():
+        async with asodarr.AsyncAPI('http://127.0.0.1:{}/api/v3'.format(server.server_address[1]), 'key') as api:
+            return await api.request('GET', path)
+    try:
+        return asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_request_retries_429():
+    server = throttled(2)
+    assert request(server, '/tag') == {'path': '/api/v3/tag'}
+    assert server.requests == 3
+
+
+def test_request_gives_up_after_http_retries(monkeypatch):
+    monkeypatch.setattr(config, 'http_retries', 1, raising=False)
+    server = throttled(5)
+    assert request(server, '/tag') == {'message': 'slow down'}
+    assert server.requests == 2
+
+
+def test_bulk_add(arr):
+    payloads = [{'tvdbId': 500 + i, 'title': 'New %d' % i} for i in range(20)]
+    results = asodarr.bulk_add(arr.url + '/api/v3', 'key', 'sonarr', payloads)
+    assert [result['ok'] for result in results] == [True] * 20
+    assert [result['response']['tvdbId'] for result in results] == [payload['tvdbId'] for payload in payloads]
+    assert len(set(result['id'] for result in results)) == 20
+    assert arr.requests == 20
+
+
+def test_bulk_add_reports_failures():
+    # nothing listens on port 9
+    results = asodarr.bulk_add('http://127.0.0.1:9/api/v3', 'key', 'radarr', [{'tmdbId': 1}])
+    assert not results[0]['ok'] and results[0]['error']
+
+
+def test_get_library(arr, monkeypatch):
+    monkeypatch.setattr(sodarr, 'CHUNK_SIZE', 1000)
+    index = asodarr.get_library('sonarr', arr.url, 'key', 'series', name='async')
+    assert len(index) == len(SERIES)
+    assert 150 in index and 99 not in index
+    assert index.get('imdb', 'tt7')['title'] == 'Show 7'
+    assert index.etag == '"v1"' and index.name == 'async' and not index.stale
+    assert library.LibraryIndex.load('sonarr', name='async') is not None
+
+
+def test_get_library_matches_sodarr(arr):
+    streamed = asodarr.get_library('sonarr', arr.url, 'key', 'series')
+    fetched = sodarr.get_library('sonarr', arr.url, 'key', 'series')
+    assert sorted(record['tvdb'] for record in streamed) == sorted(record['tvdb'] for record in fetched)
+
+
+def test_get_library_unauthorised():
+    server = replay.ReplayServer([{'method': 'GET', 'path': '/api/v3/movie', 'status': 401, 'headers': {}, 'body': ''}])
+    try:
+        with pytest.raises(sodarr.Unauthorized):
+            asodarr.get_library('radarr', server.url, 'bad', 'movie')
+    finally:
+        server.stop()
+
+
+def test_get_library_not_modified():
+    saved = library.LibraryIndex('sonarr')
+    saved.etag = '"v1"'
+    server = replay.ReplayServer([{'method': 'GET', 'path': '/api/v3/series', 'status': 304, 'headers': {}, 'body': ''}])
+    try:
+        assert asodarr.get_library('sonarr', server.url, 'key', 'series', saved) is saved
+    finally:
+        server.stop()
+    assert saved.updated is not None and not saved.stale
+
+
+def test_library_phase_uses_the_async_client(arr, monkeypatch):
+    import Pingrr
+    from lib import instances
+    monkeypatch.setattr(config, 'arr_async', True, raising=False)
+    monkeypatch.setattr(config, 'library_full_refresh', 0, raising=False)
+    fetched = []
+    get_library = asodarr.get_library
+    monkeypatch.setattr(asodarr, 'get_library', lambda *args: fetched.append(args) or get_library(*args))
+    instance = instances.Instance('sonarr', {'name': 'async-phase', 'host': arr.url, 'api': 'key'})
+    Pingrr.load_library(instance)
+    assert len(fetched) == 1
+    assert len(instance.library) == len(SERIES)
+
+
+def test_get_library_retries_429():
+    server = throttled(2, SERIES[:10])
+    try:
+        index = asodarr.get_library('sonarr', 'http://127.0.0.1:{}'.format(server.server_address[1]), 'key', 'series')
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(index) == 10
+    assert server.requests == 3
+
+
+def test_answers_are_recorded_like_the_sync_client(arr, monkeypatch):
+    seen = []
+    monkeypatch.setattr(session, 'response_hooks', [lambda method, url, res: seen.append(
+        (method, url.split('/api/v3')[1], res.status_code, len(res.content)))])
+    stats.reset()
+    asodarr.get_library('sonarr', arr.url, 'key', 'series')
+    asodarr.bulk_add(arr.url + '/api/v3', 'key', 'sonarr', [{'tvdbId': 1}, {'tvdbId': 2}])
+
+    assert seen[0] == ('GET', '/series', 200, len(json.dumps(SERIES)))
+    assert sorted(seen[1:])[0][:3] == ('POST', '/series', 201) and len(seen) == 3
+    host = stats.current().hosts[arr.url.split('//')[1]]
+    assert host['requests'] == 3
+    assert host['status'] == {'200': 1, '201': 2}
+    assert host['bytes'] >= len(json.dumps(SERIES))
+
+
+def test_record_then_replay_async_library(arr, tmp_path, monkeypatch):
+    fixture = str(tmp_path / 'fixture.json')
+    replay.start_recording(fixture)
+    try:
+        recorded = asodarr.get_library('sonarr', arr.url, 'key', 'series')
+    finally:
+        replay.stop_recording()
+    servers = replay.serve(replay.load(fixture))
+    try:
+        replayed = asodarr.get_library('sonarr', list(servers.values())[0].url, 'key', 'series')
+    finally:
+        for server in servers.values():
+            server.stop()
+    assert len(replayed) == len(recorded) == len(SERIES)
@@ -0,0 +1,81 @@
+import itertools
+import random
+
+import pytest
+
+from lib import batch
+from lib import filters
+from lib import library
+from lib import media
+
+pytest.importorskip('numpy')
+
+SETTINGS = {'year': {'shows': 2000, 'movies': 2000}, 'runtime': 20, 'votes': 10, 'rating': 5,
+            'allow_ended': False, 'allow_canceled': False, 'allow_returning': False,
+            'language': 'en', 'country': ['us', 'gb'], 'network': ['YouTube'], 'genre': ['anime']}
+
+VALUES = {'tvdb': [1, 2, 3, None, '4', [5]],
+          'year': [1990, 2010, 2010.5, None, '2015', True, float('nan')],
+          'runtime': [10, 45, None, '60'],
+          'votes': [5, 500, None, '500'],
+          'rating': [4.5, 8, None, '7.5', 6.0],
+          'status': ['ended', 'returning series', 'canceled', 'in production', None, ''],
+          'language': ['en', 'fr', None, ['en']],
+          'country': ['us', 'GB', 'de', None, ''],
+          'network': ['HBO', 'YouTube', None],
+          'genres': [['drama'], ['anime', 'drama'], (), None, ('comedy',)]}
+# a title passing every rule, each field of a test title is kept from it most of the time
+GOOD = {'tvdb': 7, 'year': 2010, 'runtime': 45, 'votes': 500, 'rating': 8, 'status': 'in production',
+        'language': 'en', 'country': 'us', 'network': 'HBO', 'genres': ['drama']}
+
+
+def per_title(pipeline, title):
+    try:
+        return pipeline.check(title)
+    except TypeError:
+        return None
+
+
+def shows(count, seed=1):
+    rand = random.Random(seed)
+    titles = []
+    for i in range(count):
+        title = dict((field, GOOD[field] if rand.random() < 0.85 else rand.choice(choices))
+                     for field, choices in VALUES.items())
+        title['title'] = 'Show %d' % i
+        titles.append(title)
+    return titles
+
+
+def pipelines():
+    index = library.LibraryIndex('sonarr')
+    index.add({'id': 1, 'tvdb': 1, 'tmdb': None, 'imdb': None, 'title': 'Show', 'path': '', 'tags': [], 'added': None})
+    yield filters.Pipeline('shows', None, SETTINGS.get)
+    yield filters.Pipeline('shows', index, SETTINGS.get)
+    yield filters.Pipeline('shows', {2, 3}, SETTINGS.get)
+    yield filters.Pipeline('shows', index, dict(SETTINGS, allow_ended=True, network=[], language='en,fr').get)
+
+
+@pytest.mark.parametrize('pipeline', list(pipelines()))
+def test_batch_matches_per_title(pipeline):
+    titles = shows(3000)
+    assert batch.check_batch(pipeline, titles) == [per_title(pipeline, title) for title in titles]
+
+
+def test_batch_matches_per_title_on_records():
+    pipeline = next(itertools.islice(pipelines(), 1, None))
+    titles = []
+    for title in shows(3000):
+        # records hold hashable genre tuples and no list valued fields
+        if isinstance(title['language'], list) or isinstance(title['tvdb'], list):
+            continue
+        title['genres'] = media.intern_genres(title['genres'])
+        titles.append(media.Show(**title))
+    assert batch.check_batch(pipeline, titles) == [per_title(pipeline, title) for title in titles]
+
+
+def test_iter_checked_skips_titles_that_can_not_be_checked():
+    pipeline = filters.Pipeline('shows', None, SETTINGS.get)
+    titles = shows(500, seed=2)
+    expected = [(title, ) + per_title(pipeline, title) for title in titles if per_title(pipeline, title) is not None]
+    assert list(batch.iter_checked(pipeline, titles, 64)) == expected
@@ -0,0 +1,45 @@
+import sqlite3
+
+from lib import decisions
+from lib import filters
+
+SETTINGS = {'year': {'shows': 2000, 'movies': 2000}, 'runtime': 20, 'votes': 10, 'rating': 5,
+            'allow_ended': True, 'allow_canceled': True, 'allow_returning': True,
+            'language': 'en', 'country': ['us'], 'network': [], 'genre': ['anime'], 'batch_size': 0}
+
+TITLE = {'trakt': 1, 'title': 'Show', 'year': 1990, 'runtime': 30, 'votes': 50, 'rating': 7, 'status': 'ended',
+         'language': 'en', 'country': 'us', 'network': 'HBO', 'genres': ['drama']}
+
+
+def test_fingerprint_ignores_batch_size():
+    fingerprint = filters.fingerprint('shows', SETTINGS.get)
+    assert filters.fingerprint('shows', dict(SETTINGS, batch_size=5000).get) == fingerprint
+    assert filters.fingerprint('shows', dict(SETTINGS, votes=11).get) != fingerprint
+    assert filters.fingerprint('movies', SETTINGS.get) != fingerprint
+
+
+def test_rejections_are_kept_per_scope(tmp_path):
+    path = str(tmp_path / 'pingrr.db')
+    store = decisions.DecisionStore('sonarr-4k', 'f1', path)
+    store.record(TITLE, 'year')
+    store.save()
+    assert decisions.DecisionStore('sonarr-4k', 'f1', path).known(TITLE) == 'year'
+    assert decisions.DecisionStore('sonarr', 'f1', path).known(TITLE) is None
+    assert decisions.DecisionStore('sonarr-4k', 'f2', path).known(TITLE) is None
+
+
+def test_item_type_column_is_renamed(tmp_path):
+    path = str(tmp_path / 'pingrr.db')
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE decisions (item_type TEXT, trakt INTEGER, digest TEXT, rule TEXT, seen REAL, "
+               "PRIMARY KEY (item_type, trakt))")
+    db.execute("INSERT INTO decisions VALUES (?, ?, ?, ?, strftime('%s', 'now'))",
+               ('sonarr', 1, decisions.digest(TITLE, 'f1'), 'year'))
+    db.commit()
+    db.close()
+
+    assert decisions.DecisionStore('sonarr', 'f1', path).known(TITLE) == 'year'
+    db = sqlite3.connect(path)
+    columns = [column[1] for column in db.execute("PRAGMA table_info(decisions)")]
+    db.close()
+    assert 'scope' in columns and 'item_type' not in columns
@@ -0,0 +1,43 @@
+import json
+import logging
+
+import Pingrr
+from lib import instances
+from lib import replay
+
+PROFILES = [{'id': 1, 'name': 'HD'}]
+FOLDERS = [{'path': '/tv/', 'freeSpace': 0}]
+
+
+def exchange(path, status, body):
+    return {'method': 'GET', 'path': path, 'status': status, 'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(body)}
+
+
+def instance(server, name):
+    return instances.Instance('sonarr', {'name': name, 'host': server.url, 'api': 'key', 'quality_profile': 1,
+                                         'path_root': '/tv/', 'tag_id': None, 'monitored': True, 'search': False})
+
+
+def test_unauthorised_metadata_skips_only_that_instance(caplog):
+    server = replay.ReplayServer([exchange('/api/v3/qualityprofile', 401, {'error': 'Unauthorized'})])
+    try:
+        with caplog.at_level(logging.ERROR):
+            Pingrr.check_instance(instance(server, 'bad-key'), [])
+    finally:
+        server.stop()
+    assert any('401' in record.getMessage() and 'bad-key' in record.getMessage() for record in caplog.records)
+
+
+def test_unauthorised_library_skips_only_that_instance(caplog, tmp_path, monkeypatch):
+    monkeypatch.setattr(Pingrr.library, 'data_file', lambda name: str(tmp_path / name))
+    server = replay.ReplayServer([exchange('/api/v3/qualityprofile', 200, PROFILES),
+                                  exchange('/api/v3/rootfolder', 200, FOLDERS),
+                                  exchange('/api/v3/tag', 200, []),
+                                  exchange('/api/v3/series', 401, {'error': 'Unauthorized'})])
+    try:
+        with caplog.at_level(logging.ERROR):
+            Pingrr.check_instance(instance(server, 'bad-library'), [])
+    finally:
+        server.stop()
+    assert any('401' in record.getMessage() and 'bad-library' in record.getMessage() for record in caplog.records)
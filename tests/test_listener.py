@@ -0,0 +1,114 @@
+import json
+
+import pytest
+import requests
+
+import config
+from lib import library
+from lib import listener
+
+
+@pytest.fixture
+def webhooks(monkeypatch):
+    monkeypatch.setattr(config, 'webhook_host', '127.0.0.1', raising=False)
+    monkeypatch.setattr(config, 'webhook_port', 0, raising=False)
+    index = library.LibraryIndex('sonarr')
+    server = listener.start(lambda name: index if name == 'sonarr' else None)
+    yield 'http://127.0.0.1:{}/webhook/'.format(server.server_address[1]), index
+    listener.stop()
+
+
+def series_event(event_type, series_id, tvdb_id):
+    return {'eventType': event_type, 'series': {'id': series_id, 'tvdbId': tvdb_id, 'title': 'Show %d' % series_id}}
+
+
+def test_add_and_delete(webhooks):
+    url, index = webhooks
+    assert requests.post(url + 'sonarr', json=series_event('SeriesAdd', 1, 10)).json() == {'result': 'added'}
+    assert 10 in index
+    assert requests.post(url + 'sonarr', json=series_event('SeriesDelete', 1, 10)).json() == {'result': 'removed'}
+    assert 10 not in index
+
+
+@pytest.mark.parametrize('body', ['[{"eventType": "SeriesAdd"}]', '"SeriesAdd"', '3', 'null', '{'])
+def test_bad_bodies_get_400(webhooks, body):
+    url, index = webhooks
+    r = requests.post(url + 'sonarr', data=body, headers={'Content-Type': 'application/json'})
+    assert r.status_code == 400
+    assert len(index) == 0
+
+
+def test_unknown_instance(webhooks):
+    url, index = webhooks
+    assert requests.post(url + 'radarr', data=json.dumps({'eventType': 'Test'})).json() == {'result': 'not loaded'}
+
+
+def test_item_that_is_not_an_object_is_ignored(webhooks):
+    url, index = webhooks
+    assert requests.post(url + 'sonarr', json={'eventType': 'SeriesAdd', 'series': [1]}).json() == {'result': 'ignored'}
+
+
+@pytest.fixture
+def watched(monkeypatch):
+    """A sonarr instance whose webhooks are received"""
+    import Pingrr
+    from lib import instances
+    monkeypatch.setattr(config, 'webhook_host', '127.0.0.1', raising=False)
+    monkeypatch.setattr(config, 'webhook_port', 0, raising=False)
+    instance = instances.Instance('sonarr', {'name': 'watched', 'host': 'http://127.0.0.1:9', 'api': 'key'})
+    server = listener.start(lambda name: instance.library if name == 'watched' else None)
+    yield Pingrr, instance, 'http://127.0.0.1:{}/webhook/watched'.format(server.server_address[1])
+    listener.stop()
+
+
+def downloaded(*tvdb_ids):
+    index = library.LibraryIndex('sonarr', 'watched')
+    index.extend({'id': tvdb_id, 'tvdbId': tvdb_id, 'title': 'Show %d' % tvdb_id} for tvdb_id in tvdb_ids)
+    return index
+
+
+def test_saved_index_is_not_taken_as_current(watched, monkeypatch):
+    Pingrr, instance, url = watched
+    saved = downloaded(1)
+    saved.stale = True
+    monkeypatch.setattr(Pingrr.sodarr, 'sync_library', lambda *args: saved)
+    Pingrr.load_library(instance)
+    assert instance.library is saved
+    assert saved.stale and not saved.live
+
+
+def test_events_during_a_refresh_reach_the_new_index(watched, monkeypatch):
+    Pingrr, instance, url = watched
+    instance.library = downloaded(1, 2)
+    new = downloaded(1, 2)
+
+    def sync_library(*args):
+        # sonarr sends these while the library is being downloaded
+        assert requests.post(url, json=series_event('SeriesAdd', 3, 3)).json() == {'result': 'added'}
+        assert requests.post(url, json=series_event('SeriesDelete', 2, 2)).json() == {'result': 'removed'}
+        return new
+
+    monkeypatch.setattr(Pingrr.sodarr, 'sync_library', sync_library)
+    Pingrr.load_library(instance)
+    assert instance.library is new
+    assert 3 in new and 2 not in new
+    assert new.live and not new.stale
+
+    # a current index stays current between full refreshes
+    new.stale = True
+    monkeypatch.setattr(Pingrr.sodarr, 'sync_library', lambda *args: new)
+    Pingrr.load_library(instance)
+    assert not new.stale
+
+
+def test_events_before_the_first_library_are_queued(watched, monkeypatch):
+    Pingrr, instance, url = watched
+    new = downloaded(1)
+
+    def sync_library(*args):
+        assert requests.post(url, json=series_event('SeriesAdd', 5, 5)).json() == {'result': 'queued'}
+        return new
+
+    monkeypatch.setattr(Pingrr.sodarr, 'sync_library', sync_library)
+    Pingrr.load_library(instance)
+    assert 5 in new
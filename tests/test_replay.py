@@ -0,0 +1,84 @@
+import json
+from urllib.parse import urlsplit
+
+import pytest
+
+import benchmark
+import config
+from lib import instances
+from lib import replay
+
+# filters that let every synthetic title through
+FILTERS = {'year': {'movies': 0, 'shows': 0}, 'runtime': 0, 'votes': 0, 'rating': 0, 'allow_ended': True,
+           'allow_canceled': True, 'allow_returning': True, 'language': 'en', 'country': ['us', 'jp'], 'network': [],
+           'genre': []}
+
+
+@pytest.fixture
+def settings():
+    """Restore the config module after benchmark.configure rewrote it"""
+    saved = dict(vars(config))
+    for name, value in FILTERS.items():
+        setattr(config, 'filters_' + name, value)
+    yield
+    for name in list(vars(config)):
+        if name not in saved:
+            delattr(config, name)
+    for name, value in saved.items():
+        setattr(config, name, value)
+    instances._instances.clear()
+
+
+def run(path):
+    import Pingrr
+    config.record_http = path
+    Pingrr.run_once()
+    with open(path) as f:
+        return json.load(f)['exchanges']
+
+
+def trakt_exchanges(exchanges, host):
+    return [exchange for exchange in exchanges if exchange['host'] == host]
+
+
+def test_record_then_replay_with_the_cache_on(settings, tmp_path):
+    config.trakt_limit = benchmark.PAGE_SIZE
+    servers = replay.serve(benchmark.synthetic(20, 20))
+    try:
+        tmp_path.joinpath('recorded').mkdir()
+        benchmark.configure(servers, str(tmp_path / 'recorded'), 20, True)
+        config.trakt_cache_ttl = {'anticipated': 3600, 'popular': 3600, 'trending': 3600}
+        instances._instances.clear()
+        first = run(str(tmp_path / 'first.json'))
+        # the second run finds the trakt lists cached, the library index saved and the profiles resolved
+        second = run(str(tmp_path / 'second.json'))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    trakt_host = urlsplit(config.trakt_url).netloc
+    assert len(trakt_exchanges(first, trakt_host)) == 6
+    assert len(trakt_exchanges(second, trakt_host)) == 6
+    assert all(exchange['status'] == 200 for exchange in second if exchange['method'] == 'GET')
+    assert sorted((e['host'], e['path']) for e in second if e['method'] == 'GET') == \
+        sorted((e['host'], e['path']) for e in first if e['method'] == 'GET')
+
+    servers = replay.serve(replay.load(str(tmp_path / 'second.json')))
+    try:
+        config.record_http = ''
+        tmp_path.joinpath('replayed').mkdir()
+        config.data_folder = str(tmp_path / 'replayed')
+        config.trakt_url = benchmark.moved(config.trakt_url, servers[trakt_host])
+        for program in ('sonarr', 'radarr'):
+            host = getattr(config, program + '_host')
+            setattr(config, program + '_host', benchmark.moved(host, servers[urlsplit(host).netloc]))
+        instances._instances.clear()
+        import Pingrr
+        Pingrr.run_once()
+        # every list is read from the fixture, so the titles are added again
+        assert servers[trakt_host].requests == 6
+        assert [e for e in second if e['method'] == 'POST']
+        assert sum(server.requests for server in servers.values()) == len(second)
+    finally:
+        for server in servers.values():
+            server.stop()
@@ -0,0 +1,67 @@
+import logging
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from lib import library
+from lib import replay
+from lib import session
+from lib import sodarr
+
+
+def stalling_server(reply=b''):
+    """A server that reads the request, sends reply and then never answers further"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(10)
+    accepted = []
+
+    def serve():
+        while True:
+            conn, address = sock.accept()
+            accepted.append(conn)
+            conn.recv(65536)
+            if reply:
+                conn.sendall(reply)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(sock.getsockname()[1]), accepted
+
+
+def test_read_timeout_is_not_retried():
+    url, accepted = stalling_server()
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        session.get(url + '/api/v3/series', timeout=0.3)
+    assert len(accepted) == 1
+    assert time.monotonic() - start < 2
+
+
+def test_library_body_timeout_is_a_read_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(library, 'data_file', lambda name: str(tmp_path / name))
+    get = session.get
+    monkeypatch.setattr(session, 'get', lambda url, **kwargs: get(url, **dict(kwargs, timeout=0.3)))
+    headers = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 100000\r\n\r\n[{"tvdbId": 1'
+    url, accepted = stalling_server(headers)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        sodarr.get_library('sonarr', url, 'key', 'series', name='sonarr-test')
+
+
+def test_log_stats_reports_each_run(caplog):
+    server = replay.ReplayServer([{'method': 'GET', 'path': '/ping', 'status': 200, 'headers': {}, 'body': '{}'}])
+    try:
+        for run in range(2):
+            caplog.clear()
+            for i in range(3):
+                session.get(server.url + '/ping')
+            with caplog.at_level(logging.INFO, logger='lib.session'):
+                session.log_stats()
+            host = server.url.split('//')[1]
+            lines = [record.getMessage() for record in caplog.records if record.getMessage().startswith(host)]
+            assert len(lines) == 1
+            assert lines[0].startswith('{}: 3 requests'.format(host))
+    finally:
+        server.stop()
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from lib import sodarr
+
+
+def parse(chunks):
+    return list(sodarr.iter_json_array(chunk.encode('utf-8') for chunk in chunks))
+
+
+def test_number_split_across_chunks():
+    assert parse(['[-0.', '5]']) == [-0.5]
+    assert parse(['[1e', '3, 2', '.5 ', ' ]']) == [1000.0, 2.5]
+
+
+def test_every_split_point():
+    doc = json.dumps([1, -2.5e-3, "s", None, True, {"a": [1, 2]}, [3], 0.0001, "é"])
+    data = doc.encode('utf-8')
+    for i in range(len(data) + 1):
+        chunks = [data[:i], data[i:]]
+        assert list(sodarr.iter_json_array(chunks)) == json.loads(doc)
+
+
+def test_truncated_array():
+    with pytest.raises(ValueError):
+        parse(['[1, 2'])